@@ -1,18 +1,13 @@
 from .graph import get_competition_research_graph
-from tools.browser_manager import BrowserManager
+from tools.scrape_service import scrape_service
 
 class CompetitionResearcher:
     def __init__(self):
         self.graph = get_competition_research_graph()
     
-    async def cleanup(self):
-        await BrowserManager.close_browser()
-    
     async def ainvoke(self, **kwargs):
-        try:
-            result = await self.graph.ainvoke(kwargs)
-            return result
-        finally:
-            await self.cleanup()
-
-
+        # Launch the browser while the first search queries are being generated. The browser
+        # pool lives on the scrape service thread and stays warm across runs until it idles out.
+        scrape_service.warm_up()
+        result = await self.graph.ainvoke(kwargs)
+        return result
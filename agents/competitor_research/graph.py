@@ -10,7 +10,7 @@ from langchain_core.runnables import RunnableConfig
 
 from langgraph.constants import Send
 from tools.tavily_search import  get_unique_urls
-from tools.serper_search import serper_search_async, deduplicate_and_format_sources, get_unique_urls
+from tools.serper_search import serper_search_async, deduplicate_and_format_sources_async, get_unique_urls
 import datetime
 
 query_generator_model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
@@ -45,7 +45,7 @@ async def search_for_competitors(state: CompetitionState, config: RunnableConfig
     )
 
     # generate queries 
-    output = structured_llm.invoke([
+    output = await structured_llm.ainvoke([
         SystemMessage(content=system_instructions_query),
         HumanMessage(content="Generate search queries that will help with researching competitors for the inputted service description.")
     ])
@@ -96,9 +96,9 @@ async def analyze_competitor_search_results(state: CompetitionState):
 
     competitors = set()
     for source_group in source_groups:
-        sources = deduplicate_and_format_sources(source_group, max_tokens_per_source=state["num_competition_tokens_per_source"], include_raw_content=False)
+        sources = await deduplicate_and_format_sources_async(source_group, max_tokens_per_source=state["num_competition_tokens_per_source"], include_raw_content=False, main_content=True)
     
-        output = model_with_structured_output.invoke([
+        output = await model_with_structured_output.ainvoke([
             SystemMessage(content=system_instructions_query),
             HumanMessage(content=[
                 *sources,
@@ -174,7 +174,7 @@ async def search_for_competitor_stats(state: CompetitorState):
 
     llm_with_structured_output = report_writer_model.with_structured_output(QueryGeneratorOutput, method="json_schema")
 
-    output = llm_with_structured_output.invoke([
+    output = await llm_with_structured_output.ainvoke([
         SystemMessage(content=system_instructions),
         HumanMessage(content="Generate search queries that will help with researching competitors for the inputted service description.")
     ])
@@ -186,7 +186,7 @@ async def search_for_competitor_stats(state: CompetitorState):
     search_docs = await serper_search_async(queries, tavily_topic="general", max_results=state["num_stat_results"])
 
     # deduplicate and format sources 
-    source_str = deduplicate_and_format_sources(search_docs, max_tokens_per_source=state["num_stat_tokens_per_source"], include_raw_content=False)
+    source_str = await deduplicate_and_format_sources_async(search_docs, max_tokens_per_source=state["num_stat_tokens_per_source"], include_raw_content=False, main_content=True)
 
     return {"stat_source_content": source_str, "stat_sources": get_unique_urls(search_docs) }
 
@@ -215,7 +215,7 @@ async def analyze_competitor_stats_search_results(state: CompetitorState):
     # get llm to analyze the search results 
     model_with_structured_output = report_writer_model.with_structured_output(CompetitorOutput, method="json_schema")
 
-    output = model_with_structured_output.invoke([
+    output = await model_with_structured_output.ainvoke([
         SystemMessage(content=system_instructions),
         HumanMessage(content=[
             *state["stat_source_content"],
@@ -270,7 +270,7 @@ async def search_for_competitor_products(state: CompetitorState):
     # get llm to search for competitor products 
     llm_with_structured_output = report_writer_model.with_structured_output(QueryGeneratorOutput, method="json_schema")
 
-    output = llm_with_structured_output.invoke([
+    output = await llm_with_structured_output.ainvoke([
         SystemMessage(content=system_instructions),
         HumanMessage(content="Generate search queries that will help with researching competitors for the inputted business idea.")
     ])
@@ -283,7 +283,7 @@ async def search_for_competitor_products(state: CompetitorState):
     search_docs = await serper_search_async(queries, tavily_topic="general", max_results=state["num_product_results"])
 
     # deduplicate and format sources 
-    source_str = deduplicate_and_format_sources(search_docs, max_tokens_per_source=state["num_product_tokens_per_source"], include_raw_content=False)
+    source_str = await deduplicate_and_format_sources_async(search_docs, max_tokens_per_source=state["num_product_tokens_per_source"], include_raw_content=False, main_content=True)
     print("length of source_str", len(source_str))
     return {"product_source_content": source_str, "product_sources": get_unique_urls(search_docs)}
 
@@ -311,7 +311,7 @@ async def analyze_competitor_products_search_results(state: CompetitorState):
         business_idea=state["business_idea"]
     )
 
-    output = llm_with_structured_output.invoke([
+    output = await llm_with_structured_output.ainvoke([
         SystemMessage(content=system_instructions),
         HumanMessage(content=[
             *state["product_source_content"],
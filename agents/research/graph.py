@@ -35,7 +35,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 load_dotenv()
-from tools.tavily_search import tavily_search_async, deduplicate_and_format_sources
+from tools.tavily_search import tavily_search_async, deduplicate_and_format_sources, deduplicate_and_format_sources_async
 
 # ------------------------------------------------------------
 # LLMs 
@@ -229,7 +229,7 @@ async def search_web(state: SectionState, config: RunnableConfig):
     search_docs = await tavily_search_async(query_list, tavily_topic, tavily_days)
 
     # Deduplicate and format sources
-    source_str = deduplicate_and_format_sources(search_docs, max_tokens_per_source=5000, include_raw_content=True)
+    source_str = await deduplicate_and_format_sources_async(search_docs, max_tokens_per_source=5000, include_raw_content=True, main_content=True)
 
     return {"source_str": source_str}
 
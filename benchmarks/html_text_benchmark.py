@@ -0,0 +1,101 @@
+"""
+Benchmark the HTML-to-text backends over a corpus of saved pages.
+
+Usage:
+    python -m benchmarks.html_text_benchmark path/to/corpus [--repeat 3] [--backends selectolax,lxml,bs4]
+
+The corpus is a directory of .html/.htm files (searched recursively), e.g. pages saved
+from the browser or dumped from raw_content of scrape results. For every installed
+backend it reports throughput, and output equivalence against the BeautifulSoup
+reference as the share of identical outputs and the mean overlap of output lines.
+"""
+import argparse
+import os
+import time
+from typing import Dict, List
+
+from tools.html_text import BACKENDS, available_backends
+
+REFERENCE_BACKEND = "bs4"
+
+
+def load_corpus(directory: str) -> Dict[str, str]:
+    """Read every HTML file below a directory, keyed by its relative path."""
+    corpus = {}
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith((".html", ".htm")):
+                path = os.path.join(root, name)
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    corpus[os.path.relpath(path, directory)] = f.read()
+    return corpus
+
+
+def line_overlap(text: str, reference: str) -> float:
+    """Jaccard similarity of the sets of output lines."""
+    lines, reference_lines = set(text.splitlines()), set(reference.splitlines())
+    if not lines and not reference_lines:
+        return 1.0
+    return len(lines & reference_lines) / len(lines | reference_lines)
+
+
+def run_backend(name: str, pages: List[str], repeat: int):
+    """Extract all pages with a backend, returning the outputs and the best wall time."""
+    extract = BACKENDS[name]
+    best = float("inf")
+    outputs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = [extract(html) for html in pages]
+        best = min(best, time.perf_counter() - start)
+    return outputs, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML-to-text backends")
+    parser.add_argument("corpus", help="Directory of saved .html pages")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per backend, the fastest is reported")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Comma separated backends to compare")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        raise SystemExit(f"No .html files found in {args.corpus}")
+    names = list(corpus)
+    pages = [corpus[name] for name in names]
+    total_mb = sum(len(html.encode("utf-8")) for html in pages) / (1024 * 1024)
+    print(f"corpus: {len(pages)} pages, {total_mb:.1f} MB")
+
+    installed = available_backends()
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if REFERENCE_BACKEND not in backends:
+        backends.append(REFERENCE_BACKEND)
+
+    results = {}
+    for backend in backends:
+        if backend not in installed:
+            print(f"{backend}: not installed, skipped")
+            continue
+        results[backend] = run_backend(backend, pages, args.repeat)
+
+    if REFERENCE_BACKEND not in results:
+        raise SystemExit("BeautifulSoup is required as the reference backend")
+    reference_outputs, reference_time = results[REFERENCE_BACKEND]
+
+    print(f"{'backend':<12}{'pages/s':>10}{'MB/s':>10}{'speedup':>10}{'identical':>11}{'line overlap':>14}")
+    for backend, (outputs, elapsed) in results.items():
+        identical = sum(o == r for o, r in zip(outputs, reference_outputs)) / len(pages)
+        overlap = sum(line_overlap(o, r) for o, r in zip(outputs, reference_outputs)) / len(pages)
+        print(
+            f"{backend:<12}{len(pages) / elapsed:>10.1f}{total_mb / elapsed:>10.2f}"
+            f"{reference_time / elapsed:>9.1f}x{identical:>10.0%}{overlap:>14.3f}"
+        )
+
+    for backend, (outputs, _) in results.items():
+        differing = [name for name, o, r in zip(names, outputs, reference_outputs) if line_overlap(o, r) < 0.9]
+        if backend != REFERENCE_BACKEND and differing:
+            print(f"{backend}: {len(differing)} pages differ noticeably from {REFERENCE_BACKEND}, e.g. {', '.join(differing[:5])}")
+
+
+if __name__ == "__main__":
+    main()
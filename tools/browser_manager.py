@@ -1,75 +1,486 @@
 import asyncio
 from pyppeteer import launch
-from typing import Dict
+from typing import Dict, List
 import os
 from contextlib import asynccontextmanager
 
-class BrowserManager:
-    _browser = None
-    _pages: Dict = {}  # Track pages by URL to prevent duplicate scraping
-    _reference_count = 0
-    _lock = asyncio.Lock()
-    
-    @classmethod
-    async def get_browser(cls):
-        async with cls._lock:
-            if not cls._browser:
-                cls._browser = await launch(
+from .request_blocking import RequestBlockingPolicy, default_request_blocking_policy, request_blocking_enabled
+
+DEFAULT_VIEWPORT = {'width': 800, 'height': 600}
+
+
+def process_tree_rss(pid: int) -> int:
+    """
+    Return the resident memory in bytes of a process and all of its descendants.
+
+    Uses psutil when installed and falls back to reading /proc, returning 0 if neither works.
+    """
+    try:
+        import psutil
+        process = psutil.Process(pid)
+        return sum(p.memory_info().rss for p in [process, *process.children(recursive=True)])
+    except ImportError:
+        pass
+    except Exception:
+        return 0
+
+    try:
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The command name may contain spaces, the parent pid follows the closing parenthesis
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        total = 0
+        pending = [pid]
+        while pending:
+            current = pending.pop()
+            try:
+                with open(f'/proc/{current}/statm') as f:
+                    total += int(f.read().split()[1]) * page_size
+            except (OSError, IndexError, ValueError):
+                pass
+            pending.extend(children.get(current, []))
+        return total
+    except (OSError, ValueError):
+        return 0
+
+
+class BrowserCrashedError(Exception):
+    """Exception raised when the browser serving a page crashed or stopped responding."""
+    def __init__(self, message="Browser crashed"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class BrowserInstance:
+    """
+    One Chromium process of the pool with its own set of reusable pages.
+
+    Released pages are reset and kept for reuse, and the process is shut down after it
+    has been idle for BrowserManager.idle_timeout seconds. A crashed or unresponsive
+    instance is killed and relaunched the next time it is dispatched to, and a draining
+    instance finishes its in-flight pages and then closes.
+    """
+
+    def __init__(self, slot: int):
+        self.slot = slot
+        self.browser = None
+        self.loop = None
+        self.generation = 0
+        self.healthy = True
+        self.idle_pages: List = []
+        self.page_contexts: Dict = {}  # Page -> its incognito browser context
+        self.context_uses: Dict = {}  # Page -> number of scrapes served by its context
+        self.pages_in_use = 0
+        self.pages_served = 0
+        self.draining = False
+        self.idle_shutdown = None
+        self._lock = None
+        self._lock_loop = None
+        self._closing = False
+
+    @property
+    def launched(self) -> bool:
+        return self.browser is not None
+
+    def _get_lock(self) -> asyncio.Lock:
+        # asyncio locks are bound to a loop, and every asyncio.run creates a new one
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    async def ensure_launched(self):
+        async with self._get_lock():
+            if self.browser and (self.loop is not asyncio.get_running_loop() or not self.healthy):
+                self.kill()
+            if not self.browser:
+                print(f"launching browser {self.slot}")
+                self.browser = await launch(
                     executablePath=os.getenv("CHROMIUM_PATH"),
                     headless=True,
                     args=['--no-sandbox', '--disable-dev-shm-usage'],
-                    autoClose=False
+                    autoClose=False,
+                    # Signal handlers can only be installed on the main thread, the pool
+                    # runs on the scrape service thread and is closed by it on exit
+                    handleSIGINT=False,
+                    handleSIGTERM=False,
+                    handleSIGHUP=False
                 )
-            cls._reference_count += 1
-        return cls._browser
+                self.browser.on('disconnected', self._on_disconnected)
+                self.loop = asyncio.get_running_loop()
+                self.generation += 1
+                self.healthy = True
+        return self.browser
+
+    def _on_disconnected(self):
+        if not self._closing:
+            print(f"browser {self.slot} disconnected unexpectedly")
+            self.healthy = False
+
+    async def is_responsive(self, timeout: float = 5) -> bool:
+        """Check that the browser process is alive and answers DevTools requests."""
+        if not self.browser:
+            return True
+        if not self.healthy:
+            return False
+        process = getattr(self.browser, 'process', None)
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            await asyncio.wait_for(self.browser.version(), timeout)
+            return True
+        except Exception:
+            return False
+
+    def kill(self):
+        """Terminate the browser process without waiting for it, dropping all of its pages."""
+        if self.browser:
+            print(f"killing browser {self.slot}")
+            try:
+                self.browser.process.terminate()
+            except Exception as e:
+                print(f"Error terminating browser {self.slot}: {e}")
+        self._reset_state()
+
+    def _reset_state(self):
+        if self.idle_shutdown and self.idle_shutdown is not asyncio.current_task():
+            self.idle_shutdown.cancel()
+        self.idle_shutdown = None
+        self.browser = None
+        self.idle_pages = []
+        self.page_contexts = {}
+        self.context_uses = {}
+        self.pages_in_use = 0
+        self.pages_served = 0
+        self.healthy = True
+
+    async def rss_bytes(self) -> int:
+        """Return the resident memory of the browser and its renderer processes."""
+        process = getattr(self.browser, 'process', None) if self.browser else None
+        if process is None:
+            return 0
+        return await asyncio.to_thread(process_tree_rss, process.pid)
+
+    async def acquire_page(self):
+        browser = await self.ensure_launched()
+        if self.idle_shutdown:
+            self.idle_shutdown.cancel()
+            self.idle_shutdown = None
+        self.pages_served += 1
+        while self.idle_pages:
+            page = self.idle_pages.pop()
+            if not page.isClosed():
+                self.context_uses[page] = self.context_uses.get(page, 0) + 1
+                return page
+            await self._close_page(page)
+        page = await self._new_page(browser)
+        self.context_uses[page] = 1
+        return page
+
+    async def _new_page(self, browser):
+        """Open a page in its own incognito context, so cookies and cache never leak between scrapes."""
+        if not BrowserManager.incognito_contexts:
+            return await browser.newPage()
+        context = await browser.createIncognitoBrowserContext()
+        try:
+            page = await context.newPage()
+        except Exception:
+            await context.close()
+            raise
+        self.page_contexts[page] = context
+        return page
+
+    async def _close_page(self, page):
+        """Close a page together with its incognito context."""
+        context = self.page_contexts.pop(page, None)
+        self.context_uses.pop(page, None)
+        try:
+            if context is not None:
+                await context.close()
+            elif not page.isClosed():
+                await page.close()
+        except Exception as e:
+            print(f"Error closing page: {e}")
+
+    async def warm_up(self, pages: int):
+        browser = await self.ensure_launched()
+        while len(self.idle_pages) < pages:
+            self.idle_pages.append(await self._new_page(browser))
+        if self.pages_in_use == 0:
+            self._schedule_idle_shutdown()
+
+    async def _reset_page(self, page) -> bool:
+        """Return a page to a blank state for reuse. Returns False if it should be closed instead."""
+        try:
+            page.remove_all_listeners('request')
+            page.remove_all_listeners('response')
+            origin = None
+            if page.url.startswith('http'):
+                origin = await asyncio.wait_for(page.evaluate('() => location.origin'), 5)
+            await asyncio.wait_for(page.setRequestInterception(False), 5)
+            await asyncio.wait_for(page.goto('about:blank'), 5)
+            await asyncio.wait_for(page.setViewport(DEFAULT_VIEWPORT), 5)
+            # Drop the cookies, cache and storage of the previous scrape before the context is reused
+            await asyncio.wait_for(page._client.send('Network.clearBrowserCookies'), 5)
+            await asyncio.wait_for(page._client.send('Network.clearBrowserCache'), 5)
+            if origin:
+                await asyncio.wait_for(page._client.send('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'}), 5)
+            return True
+        except Exception as e:
+            print(f"Error resetting page for reuse: {e}")
+            return False
+
+    async def release_page(self, page, generation: int):
+        # Pages of a browser that has since been killed or relaunched are simply dropped
+        if generation != self.generation or not self.browser:
+            return
+        try:
+            reusable = (
+                self.healthy and not self.draining and not page.isClosed()
+                and len(self.idle_pages) < BrowserManager.page_pool_size
+                and self.context_uses.get(page, 0) < BrowserManager.max_context_uses
+            )
+            if reusable and await self._reset_page(page):
+                self.idle_pages.append(page)
+            else:
+                await self._close_page(page)
+        finally:
+            self.release_slot()
+
+    def release_slot(self):
+        self.pages_in_use = max(0, self.pages_in_use - 1)
+        if self.pages_in_use == 0 and self.browser:
+            if self.draining:
+                asyncio.ensure_future(self.close())
+            else:
+                self._schedule_idle_shutdown()
+
+    def _schedule_idle_shutdown(self):
+        if self.idle_shutdown:
+            self.idle_shutdown.cancel()
+        self.idle_shutdown = asyncio.ensure_future(self._shutdown_when_idle())
+
+    async def _shutdown_when_idle(self):
+        await asyncio.sleep(BrowserManager.idle_timeout)
+        if self.pages_in_use == 0:
+            print(f"browser {self.slot} idle for {BrowserManager.idle_timeout}s, shutting it down")
+            self.idle_shutdown = None
+            await self.close()
+
+    async def close(self):
+        async with self._get_lock():
+            if self.browser:
+                self._closing = True
+                try:
+                    await self.browser.close()
+                except Exception as e:
+                    print(f"Error during browser closure: {e}")
+                finally:
+                    self._closing = False
+                    self._reset_state()
+
+
+class BrowserManager:
+    """
+    Pool of Chromium processes shared by every scrape in the process.
+
+    Pages are dispatched to the least-loaded healthy browser. A background health check
+    kills browsers that crashed or stopped responding so they get relaunched, and pages
+    that were running on them fail with BrowserCrashedError so callers can retry.
+
+    Every pooled page lives in its own incognito context, so concurrent scrapes never
+    share cookies, consent state or cache. Contexts are wiped between uses and replaced
+    after BROWSER_CONTEXT_MAX_USES scrapes.
+
+    Chromium leaks memory over hundreds of page loads, so a browser that served
+    BROWSER_MAX_PAGES pages or grew past BROWSER_MAX_RSS_MB is recycled: a fresh instance
+    takes its slot while the old one drains its in-flight pages and closes.
+    """
+    _pages: Dict = {}  # Track pages by URL to prevent duplicate scraping
+    _page_owners: Dict = {}  # Page -> (BrowserInstance, generation)
+    _retiring: List[BrowserInstance] = []
+    _health_check = None
+
+    pool_size = int(os.getenv("BROWSER_POOL_SIZE", max(1, min(4, (os.cpu_count() or 2) // 2))))
+    idle_timeout = float(os.getenv("BROWSER_IDLE_TIMEOUT", 300))
+    page_pool_size = int(os.getenv("BROWSER_PAGE_POOL_SIZE", 6))
+    warm_pages = int(os.getenv("BROWSER_WARM_PAGES", 2))
+    health_check_interval = float(os.getenv("BROWSER_HEALTH_CHECK_INTERVAL", 30))
+    max_pages_per_browser = int(os.getenv("BROWSER_MAX_PAGES", 200))
+    max_rss_bytes = int(float(os.getenv("BROWSER_MAX_RSS_MB", 1500)) * 1024 * 1024)
+    rss_check_every = int(os.getenv("BROWSER_RSS_CHECK_EVERY", 10))
+    incognito_contexts = os.getenv("BROWSER_INCOGNITO_CONTEXTS", "true").lower() not in ("0", "false", "no")
+    max_context_uses = int(os.getenv("BROWSER_CONTEXT_MAX_USES", 20))
+
+    _instances: List[BrowserInstance] = [BrowserInstance(slot) for slot in range(pool_size)]
+
+    @classmethod
+    def _dispatch(cls) -> BrowserInstance:
+        """Pick the least-loaded browser, preferring running ones over launching a new one."""
+        loop = asyncio.get_running_loop()
+        for instance in cls._instances:
+            if instance.launched and (instance.loop is not loop or not instance.healthy):
+                instance.kill()
+        instance = min(cls._instances, key=lambda i: (i.pages_in_use, not i.launched))
+        instance.pages_in_use += 1
+        return instance
+
+    @classmethod
+    def _ensure_health_check(cls):
+        loop = asyncio.get_running_loop()
+        if cls._health_check is None or cls._health_check.done() or cls._health_check.get_loop() is not loop:
+            cls._health_check = asyncio.ensure_future(cls._run_health_checks())
+
+    @classmethod
+    async def _run_health_checks(cls):
+        while any(instance.launched for instance in cls._instances):
+            await asyncio.sleep(cls.health_check_interval)
+            await cls.check_health()
+
+    @classmethod
+    async def check_health(cls):
+        """Kill every browser of the pool that crashed or does not respond, and recycle bloated ones."""
+        for instance in list(cls._instances):
+            if not instance.launched or instance.loop is not asyncio.get_running_loop():
+                continue
+            if not await instance.is_responsive():
+                print(f"browser {instance.slot} failed its health check")
+                instance.kill()
+            else:
+                await cls._recycle_if_needed(instance, check_rss=True)
+
+    @classmethod
+    async def _recycle_if_needed(cls, instance: BrowserInstance, check_rss: bool = False):
+        if instance.draining or cls._instances[instance.slot] is not instance or not instance.launched:
+            return
+        reason = None
+        if instance.pages_served >= cls.max_pages_per_browser:
+            reason = f"served {instance.pages_served} pages"
+        elif check_rss and cls.max_rss_bytes > 0:
+            rss = await instance.rss_bytes()
+            if rss > cls.max_rss_bytes:
+                reason = f"using {rss // (1024 * 1024)} MB"
+        if reason:
+            cls._retire(instance, reason)
+
+    @classmethod
+    def _retire(cls, instance: BrowserInstance, reason: str):
+        """Replace a browser by a fresh one and let it close once its in-flight pages are done."""
+        print(f"recycling browser {instance.slot}, {reason}")
+        instance.draining = True
+        cls._instances[instance.slot] = BrowserInstance(instance.slot)
+        cls._retiring = [i for i in cls._retiring if i.launched] + [instance]
+        if instance.pages_in_use == 0:
+            asyncio.ensure_future(instance.close())
+
+    @classmethod
+    def stats(cls) -> List[dict]:
+        """Return the load of every browser in the pool, including ones that are draining."""
+        return [{
+            "slot": instance.slot,
+            "launched": instance.launched,
+            "healthy": instance.healthy,
+            "draining": instance.draining,
+            "pages_in_use": instance.pages_in_use,
+            "pages_served": instance.pages_served,
+        } for instance in cls._instances + cls._retiring]
+
+    @classmethod
+    def is_alive(cls, page) -> bool:
+        """Return whether the browser serving a page is still the healthy instance it was opened on."""
+        instance, generation = cls._page_owners.get(page, (None, None))
+        return instance is not None and instance.generation == generation and instance.launched and instance.healthy
+
+    @classmethod
+    async def get_browser(cls):
+        """Return the least-loaded running browser, launching one if necessary."""
+        instance = cls._dispatch()
+        try:
+            return await instance.ensure_launched()
+        finally:
+            instance.release_slot()
+
+    @classmethod
+    async def warm_up(cls):
+        """Launch a browser and pre-open pages so the first scrapes skip the cold start."""
+        try:
+            await cls._instances[0].warm_up(min(cls.warm_pages, cls.page_pool_size))
+            cls._ensure_health_check()
+        except Exception as e:
+            print(f"Error warming up browser: {e}")
 
     @classmethod
     @asynccontextmanager
-    async def get_page(cls, url: str):
-        browser = await cls.get_browser()
-        page = None
+    async def get_page(cls, url: str, block_images: bool = False, blocking_policy: RequestBlockingPolicy = None):
+        """
+        Borrow a page from the least-loaded browser of the pool for the duration of the context.
+
+        Args:
+            url (str): The URL the page will load, used for tracking.
+            block_images (bool): Also abort image requests, for pages that are not screenshotted.
+            blocking_policy (RequestBlockingPolicy, optional): Interception policy, defaults to
+                the shared policy unless REQUEST_BLOCKING_ENABLED is off.
+
+        Raises:
+            BrowserCrashedError: If the browser could not provide a page.
+        """
+        instance = cls._dispatch()
+        try:
+            page = await instance.acquire_page()
+        except Exception as e:
+            instance.release_slot()
+            if not await instance.is_responsive():
+                instance.kill()
+            raise BrowserCrashedError(f"Browser {instance.slot} could not open a page: {e}")
+        generation = instance.generation
+        cls._page_owners[page] = (instance, generation)
+        cls._ensure_health_check()
+
+        failed = False
         try:
-            page = await browser.newPage()
             cls._pages[url] = page
+            if blocking_policy is None and request_blocking_enabled:
+                blocking_policy = default_request_blocking_policy
+            if blocking_policy is not None:
+                await blocking_policy.attach(page, block_images=block_images)
             yield page
+        except BaseException:
+            failed = True
+            raise
         finally:
-            if page:
-                try:
-                    # Remove from tracking dict first
-                    if url in cls._pages:
-                        del cls._pages[url]
-                    
-                    # Check if the browser is still alive before closing the page
-                    if cls._browser and not page.isClosed():
-                        try:
-                            await page.close()
-                        except Exception as e:
-                            print(f"Error closing page: {e}")
-                except Exception as e:
-                    print(f"Error during page cleanup for {url}: {e}")
-                
-                # Update reference count and potentially close browser
-                async with cls._lock:
-                    cls._reference_count -= 1
-                    if cls._reference_count == 0:
-                        try:
-                            if cls._browser:
-                                await cls._browser.close()
-                        except Exception as e:
-                            print(f"Error closing browser: {e}")
-                        finally:
-                            cls._browser = None
+            # Remove from tracking dict first
+            if cls._pages.get(url) is page:
+                del cls._pages[url]
+            cls._page_owners.pop(page, None)
+            try:
+                await instance.release_page(page, generation)
+                if instance.generation == generation:
+                    check_rss = cls.rss_check_every > 0 and instance.pages_served % cls.rss_check_every == 0
+                    await cls._recycle_if_needed(instance, check_rss=check_rss)
+            except Exception as e:
+                print(f"Error during page cleanup for {url}: {e}")
+            if failed:
+                # A page that was abandoned mid-way may have hung its browser
+                asyncio.ensure_future(cls.check_health())
 
     @classmethod
     async def close_browser(cls):
-        """Close the browser if it exists"""
-        async with cls._lock:
-            if cls._browser:
-                try:
-                    await cls._browser.close()
-                except Exception as e:
-                    print(f"Error during browser closure: {e}")
-                finally:
-                    cls._browser = None
-                    cls._reference_count = 0
-                    cls._pages.clear()
+        """Close every browser of the pool"""
+        for instance in cls._instances + cls._retiring:
+            await instance.close()
+        cls._retiring = []
+        if cls._health_check and not cls._health_check.done() and cls._health_check is not asyncio.current_task():
+            cls._health_check.cancel()
+        cls._health_check = None
+        cls._pages.clear()
+        cls._page_owners.clear()
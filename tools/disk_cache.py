@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+import asyncio
+from typing import Optional
+
+
+class DiskCache:
+    """
+    Persistent key/value cache backed by a single SQLite file.
+
+    Entries are addressed by the SHA-256 digest of their key, stored as zlib-compressed
+    JSON, expire after a per-entry TTL and are evicted least-recently-used first once
+    the total compressed size exceeds max_bytes. Safe to share between threads and
+    between processes pointing at the same file.
+    """
+
+    def __init__(self, path: str, default_ttl: float = 24 * 3600, max_bytes: int = 512 * 1024 * 1024, compression_level: int = 6):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections must not be shared across a fork, so reconnect in child processes
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    digest TEXT PRIMARY KEY,
+                    key TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def digest(key: str) -> str:
+        """Return the content address used to store a key."""
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Look up a key.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            dict | None: The cached value, or None if missing or expired.
+        """
+        digest = self.digest(key)
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute("SELECT data, expires_at FROM entries WHERE digest = ?", (digest,)).fetchone()
+                if row is None:
+                    return None
+                data, expires_at = row
+                if expires_at <= now:
+                    conn.execute("DELETE FROM entries WHERE digest = ?", (digest,))
+                    return None
+                conn.execute("UPDATE entries SET last_access = ? WHERE digest = ?", (now, digest))
+            return json.loads(zlib.decompress(data))
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            print(f"Error reading cache entry for {key[:100]}: {e}")
+            return None
+
+    def set(self, key: str, value: dict, ttl: Optional[float] = None):
+        """
+        Store a JSON-serialisable value under a key, evicting old entries if over budget.
+
+        Args:
+            key (str): The cache key.
+            value (dict): The value to store.
+            ttl (float, optional): Lifetime in seconds, defaults to default_ttl.
+        """
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        now = time.time()
+        try:
+            data = zlib.compress(json.dumps(value).encode("utf-8"), self.compression_level)
+            if len(data) > self.max_bytes:
+                return
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (digest, key, data, size, created_at, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.digest(key), key, data, len(data), now, now + ttl, now)
+                )
+                self._evict(conn, now)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"Error writing cache entry for {key[:100]}: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under budget
+        excess = total - self.max_bytes
+        for digest, size in conn.execute("SELECT digest, size FROM entries ORDER BY last_access ASC").fetchall():
+            conn.execute("DELETE FROM entries WHERE digest = ?", (digest,))
+            excess -= size
+            if excess <= 0:
+                break
+
+    def delete(self, key: str):
+        """Remove a key from the cache."""
+        with self._lock:
+            self._connection().execute("DELETE FROM entries WHERE digest = ?", (self.digest(key),))
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self._lock:
+            self._connection().execute("DELETE FROM entries")
+
+    def stats(self) -> dict:
+        """Return the number of entries and their total compressed size in bytes."""
+        with self._lock:
+            count, size = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"entries": count, "bytes": size}
+
+    async def aget(self, key: str) -> Optional[dict]:
+        """Async variant of get that keeps disk I/O off the event loop."""
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: dict, ttl: Optional[float] = None):
+        """Async variant of set that keeps disk I/O off the event loop."""
+        await asyncio.to_thread(self.set, key, value, ttl)
@@ -0,0 +1,72 @@
+from typing import Tuple
+
+# Removed from the serialised HTML, none of these carry text we use
+PRUNED_SELECTORS = (
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "embed",
+    "link[rel=stylesheet]", "link[rel=preload]", "link[rel=prefetch]", "link[rel=modulepreload]",
+)
+
+# Runs inside Chromium. innerText is read from the live document, which already skips
+# hidden and non-rendered nodes; hidden elements are then marked so they can be dropped
+# from a clone, leaving the live DOM (and later screenshots) untouched.
+_EXTRACT_SCRIPT = """
+(selectors) => {
+    const root = document.documentElement;
+    if (!root) {
+        return {text: '', html: '', original_length: 0};
+    }
+    const originalLength = root.outerHTML.length;
+    const text = (document.body ? document.body.innerText : '')
+        .split('\\n')
+        .map(line => line.trim())
+        .filter(line => line)
+        .join('\\n');
+
+    const marker = 'data-scrape-hidden';
+    const marked = [];
+    for (const el of document.body ? document.body.querySelectorAll('*') : []) {
+        if (el.checkVisibility ? !el.checkVisibility() : getComputedStyle(el).display === 'none') {
+            el.setAttribute(marker, '');
+            marked.push(el);
+        }
+    }
+    const clone = root.cloneNode(true);
+    for (const el of marked) {
+        el.removeAttribute(marker);
+    }
+
+    for (const el of clone.querySelectorAll(`[${marker}], ${selectors.join(', ')}`)) {
+        el.remove();
+    }
+    const walker = document.createTreeWalker(clone, NodeFilter.SHOW_COMMENT);
+    const comments = [];
+    while (walker.nextNode()) {
+        comments.push(walker.currentNode);
+    }
+    comments.forEach(comment => comment.remove());
+    for (const el of clone.querySelectorAll('[style]')) {
+        el.removeAttribute('style');
+    }
+
+    return {text: text, html: '<!DOCTYPE html>' + clone.outerHTML, original_length: originalLength};
+}
+"""
+
+
+async def extract_in_browser(page) -> Tuple[str, str]:
+    """
+    Extract the visible text and a pruned copy of the HTML inside Chromium.
+
+    Scripts, styles, SVGs, hidden nodes, comments and inline styles are stripped before
+    anything is serialised, so only the content we use crosses the DevTools connection
+    and no HTML parsing is needed in Python.
+
+    Args:
+        page: The pyppeteer page, after navigation.
+
+    Returns:
+        tuple: The visible text (one non-empty line per line) and the pruned HTML.
+    """
+    extracted = await page.evaluate(_EXTRACT_SCRIPT, list(PRUNED_SELECTORS))
+    print(f"pruned HTML of {page.url[:100]} from {extracted['original_length']} to {len(extracted['html'])} characters in the browser")
+    return extracted["text"], extracted["html"]
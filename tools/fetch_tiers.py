@@ -0,0 +1,96 @@
+import re
+import time
+from typing import Dict, Optional
+
+from .disk_cache import DiskCache
+from .host_limiter import host_of
+
+HTTP_TIER = "http"
+RENDER_TIER = "render"
+
+_script_or_style = re.compile(r"<(script|style|noscript|template)\b[^>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_tags = re.compile(r"<[^>]+>")
+_whitespace = re.compile(r"\s+")
+_noscript = re.compile(r"<noscript\b[^>]*>(.*?)</noscript\s*>", re.IGNORECASE | re.DOTALL)
+# Empty mount points left behind by client-side frameworks
+_empty_app_root = re.compile(
+    r"<div[^>]+id=[\"'](root|app|__next|__nuxt|svelte|main-app)[\"'][^>]*>\s*</div>",
+    re.IGNORECASE
+)
+_framework_markers = re.compile(
+    r"(window\.__NUXT__|window\.__INITIAL_STATE__|ng-version=|data-reactroot|id=[\"']__next[\"']|<app-root)",
+    re.IGNORECASE
+)
+_noscript_hints = re.compile(r"(enable javascript|javascript is (required|disabled)|requires javascript|turn on javascript)", re.IGNORECASE)
+
+
+def visible_text_length(html: str) -> int:
+    """Approximate the number of visible text characters in an HTML document."""
+    text = _tags.sub(" ", _script_or_style.sub(" ", html))
+    return len(_whitespace.sub(" ", text).strip())
+
+
+def looks_like_js_shell(html: str, min_text_length: int = 500) -> bool:
+    """
+    Guess whether an HTML response is a client-side rendered shell that needs a browser.
+
+    Args:
+        html (str): The raw HTML returned by a plain HTTP GET.
+        min_text_length (int): Pages with less visible text than this are treated as shells.
+
+    Returns:
+        bool: True if the page should be rendered with Chromium.
+    """
+    if not html:
+        return True
+    text_length = visible_text_length(html)
+    if text_length < min_text_length:
+        return True
+    noscript_text = " ".join(_noscript.findall(html))
+    if _noscript_hints.search(noscript_text) and text_length < 4 * min_text_length:
+        return True
+    if _empty_app_root.search(html):
+        return True
+    # Framework markers only matter when little server-rendered text came with them
+    return bool(_framework_markers.search(html)) and text_length < 2 * min_text_length
+
+
+class TierMemory:
+    """
+    Remembers per domain which fetch tier produced usable content, so later scrapes of
+    the same domain can skip the HTTP probe (or the browser) straight away.
+    """
+
+    def __init__(self, store: Optional[DiskCache] = None, ttl: float = 7 * 24 * 3600):
+        self.store = store
+        self.ttl = ttl
+        # (tier, recorded_at) per host, with a None tier for hosts known to have no entry
+        self._tiers: Dict[str, tuple] = {}
+
+    async def preferred_tier(self, url: str) -> Optional[str]:
+        """Return the tier that last worked for the URL's domain, or None if unknown."""
+        host = host_of(url)
+        if host not in self._tiers:
+            entry = (None, 0.0)
+            if self.store is not None:
+                stored = await self.store.aget(f"tier:{host}")
+                if stored:
+                    entry = (stored["tier"], stored["recorded_at"])
+            # Misses are remembered as well, so the store is asked once per host
+            self._tiers.setdefault(host, entry)
+        tier, recorded_at = self._tiers[host]
+        if tier is None or time.time() - recorded_at > self.ttl:
+            return None
+        return tier
+
+    async def record(self, url: str, tier: str):
+        """Remember the tier that produced usable content for the URL's domain."""
+        host = host_of(url)
+        known_tier, recorded_at = self._tiers.get(host, (None, 0.0))
+        # A confirmed tier is rewritten once it is half way to expiring, so it never lapses while in use
+        if known_tier == tier and time.time() - recorded_at < self.ttl / 2:
+            return
+        recorded_at = time.time()
+        self._tiers[host] = (tier, recorded_at)
+        if self.store is not None:
+            await self.store.aset(f"tier:{host}", {"tier": tier, "recorded_at": recorded_at}, ttl=self.ttl)
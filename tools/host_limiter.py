@@ -0,0 +1,124 @@
+import asyncio
+import os
+import time
+import weakref
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+
+def host_of(url: str) -> str:
+    """Return the host a URL is rate limited under, ignoring a leading www."""
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header given either as delta-seconds or as an HTTP date.
+
+    Returns:
+        float | None: Seconds to wait, or None if the header is missing or malformed.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _HostState:
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.refilled_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttle_count = 0
+
+
+class HostLimiter:
+    """
+    Politeness limits for scraping, applied per host.
+
+    Each host gets a token bucket (rate requests per second with a burst allowance) and
+    a concurrency cap. Hosts that answer with 429/503 are paused for their Retry-After,
+    or an exponential backoff if none is given, without slowing down other hosts.
+    """
+
+    def __init__(self, rate: float, burst: float, max_concurrency: int, base_backoff: float = 2.0, max_backoff: float = 120.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._states: Dict[str, _HostState] = {}
+        # asyncio primitives are bound to a loop, so keep the host semaphores per loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _state(self, host: str) -> _HostState:
+        if host not in self._states:
+            self._states[host] = _HostState(self.burst)
+        return self._states[host]
+
+    def _semaphore(self, host: str) -> asyncio.Semaphore:
+        semaphores = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        if host not in semaphores:
+            semaphores[host] = asyncio.Semaphore(self.max_concurrency)
+        return semaphores[host]
+
+    async def _acquire_token(self, host: str):
+        state = self._state(host)
+        while True:
+            now = time.monotonic()
+            if state.blocked_until > now:
+                await asyncio.sleep(state.blocked_until - now)
+                continue
+            state.tokens = min(self.burst, state.tokens + (now - state.refilled_at) * self.rate)
+            state.refilled_at = now
+            if state.tokens >= 1:
+                state.tokens -= 1
+                return
+            await asyncio.sleep((1 - state.tokens) / self.rate)
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """Wait until the URL's host has a free concurrency slot and a rate token."""
+        host = host_of(url)
+        async with self._semaphore(host):
+            await self._acquire_token(host)
+            yield
+
+    def record_throttle(self, url: str, retry_after: Optional[float] = None) -> float:
+        """
+        Pause a host after it throttled us.
+
+        Args:
+            url (str): The URL that was throttled.
+            retry_after (float, optional): Seconds requested by the server's Retry-After header.
+
+        Returns:
+            float: The number of seconds the host is paused for.
+        """
+        state = self._state(host_of(url))
+        state.throttle_count += 1
+        delay = retry_after if retry_after is not None else self.base_backoff * 2 ** (state.throttle_count - 1)
+        delay = min(delay, self.max_backoff)
+        state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+        state.tokens = 0
+        print(f"host {host_of(url)} throttled, backing off for {delay:.1f}s")
+        return delay
+
+    def record_success(self, url: str):
+        """Reset the backoff of a host after a successful request."""
+        self._state(host_of(url)).throttle_count = 0
+
+
+host_limiter = HostLimiter(
+    rate=float(os.getenv("SCRAPE_HOST_RATE", 1.0)),
+    burst=float(os.getenv("SCRAPE_HOST_BURST", 2)),
+    max_concurrency=int(os.getenv("SCRAPE_HOST_CONCURRENCY", 2)),
+)
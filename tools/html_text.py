@@ -0,0 +1,305 @@
+import importlib.util
+import os
+import re
+from typing import Callable, Dict, Iterable, List, Optional
+
+from bs4 import BeautifulSoup
+
+# Elements whose text is never part of the readable content
+SKIPPED_TAGS = ("script", "style")
+
+
+def _join_lines(strings: Iterable[str]) -> str:
+    """Strip every line and drop empty ones, so all backends produce the same layout."""
+    lines = (line.strip() for string in strings for line in string.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def _bs4_text(html: str) -> str:
+    soup = BeautifulSoup(html, 'html.parser')
+    for element in soup(list(SKIPPED_TAGS)):
+        element.decompose()
+    return _join_lines([soup.get_text(separator='\n', strip=True)])
+
+
+_lxml_parser = None
+
+
+def _lxml_document(html: str):
+    import lxml.html
+
+    global _lxml_parser
+    if _lxml_parser is None:
+        _lxml_parser = lxml.html.HTMLParser(encoding='utf-8')
+    # lxml rejects str input carrying an encoding declaration, so parse the UTF-8 bytes
+    return lxml.html.document_fromstring(html.encode('utf-8', errors='replace'), parser=_lxml_parser)
+
+
+def _lxml_strings(root):
+    from lxml import etree
+
+    skipped_depth = 0
+    for event, node in etree.iterwalk(root, events=("start", "end")):
+        # Comments and processing instructions have no string tag, only their tail is text
+        is_element = isinstance(node.tag, str)
+        skipped = is_element and node.tag.lower() in SKIPPED_TAGS
+        if event == "start":
+            if skipped:
+                skipped_depth += 1
+            elif is_element and not skipped_depth and node.text:
+                yield node.text
+        else:
+            if skipped:
+                skipped_depth -= 1
+            if node is not root and not skipped_depth and node.tail:
+                yield node.tail
+
+
+def _lxml_text(html: str) -> str:
+    if not html.strip():
+        return ""
+    return _join_lines(_lxml_strings(_lxml_document(html)))
+
+
+def _selectolax_text(html: str) -> str:
+    # The Lexbor engine, the older Modest based selectolax.parser is gone from recent releases
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(list(SKIPPED_TAGS))
+    if tree.root is None:
+        return ""
+    return _join_lines(node.text(deep=False) for node in tree.root.traverse(include_text=True) if node.tag == "-text")
+
+
+# Fastest first, "auto" picks the first one that is installed
+BACKENDS: Dict[str, Callable[[str], str]] = {
+    "selectolax": _selectolax_text,
+    "lxml": _lxml_text,
+    "bs4": _bs4_text,
+}
+
+_BACKEND_MODULES = {"selectolax": "selectolax", "lxml": "lxml", "bs4": "bs4"}
+_PROBE_HTML = "<html><body><p>probe</p><script>skipped</script></body></html>"
+_backend_works: Dict[str, bool] = {}
+
+
+def _backend_works_here(name: str) -> bool:
+    """Whether a backend imports and extracts a small document correctly, checked once per process."""
+    if name not in _backend_works:
+        works = False
+        if importlib.util.find_spec(_BACKEND_MODULES[name]) is not None:
+            try:
+                works = BACKENDS[name](_PROBE_HTML) == "probe"
+            except Exception as e:
+                print(f"HTML text backend {name} is installed but unusable: {e}")
+        _backend_works[name] = works
+    return _backend_works[name]
+
+
+def available_backends() -> List[str]:
+    """Return the names of the backends that are installed and work, fastest first."""
+    return [name for name in BACKENDS if _backend_works_here(name)]
+
+
+def resolve_backend(name: Optional[str] = None) -> str:
+    """
+    Resolve a backend name, falling back to BeautifulSoup if the requested one is unavailable.
+
+    Args:
+        name (str | None): A key of BACKENDS or "auto". Defaults to the HTML_TEXT_BACKEND setting.
+
+    Returns:
+        str: The name of the backend that will be used.
+    """
+    name = (name or html_text_backend).lower()
+    available = available_backends()
+    if name == "auto":
+        return available[0] if available else "bs4"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown HTML text backend: {name}")
+    if name not in available:
+        print(f"HTML text backend {name} is not available, falling back to bs4")
+        return "bs4"
+    return name
+
+
+def html_to_text(html: str, backend: Optional[str] = None) -> str:
+    """
+    Extract the readable text of an HTML document, one non-empty line per text node.
+
+    Args:
+        html (str): The HTML document.
+        backend (str | None): Backend to use, defaults to the configured one.
+
+    Returns:
+        str: The extracted text.
+    """
+    global _default_backend
+    if backend is None:
+        if _default_backend is None:
+            _default_backend = resolve_backend()
+            print(f"extracting text from HTML with {_default_backend}")
+        backend = _default_backend
+    else:
+        backend = resolve_backend(backend)
+    if backend == "bs4":
+        return _bs4_text(html)
+    try:
+        return BACKENDS[backend](html)
+    except Exception as e:
+        print(f"HTML text backend {backend} failed, falling back to bs4: {e}")
+        return _bs4_text(html)
+
+
+# Containers that hold site chrome rather than page content
+BOILERPLATE_TAGS = ("header", "footer", "nav", "aside", "form", "button", "select", "svg", "iframe", "noscript", "template", "dialog")
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search", "dialog", "alertdialog", "menu", "menubar"}
+# Matched against whole class and id tokens, so e.g. card-footer or menu-item-description are kept
+_boilerplate_names = re.compile(
+    r"(cookie|consent|gdpr)[\w-]*|navbar|nav-bar|main-nav|site-(header|footer|nav|menu)|footer|sidebar|breadcrumbs?|"
+    r"related-(posts|articles|content)|share|sharing|share-buttons|social-(share|links)|newsletter|subscribe|popup|modal|"
+    r"ads?|advert(isement)?|skip-link|comments|menu",
+    re.IGNORECASE
+)
+_content_names = re.compile(r"article|main|content|post|entry|story|pricing|product|feature", re.IGNORECASE)
+MAIN_CONTENT_BLOCK_TAGS = ("div", "section", "ul", "ol", "dl", "table", "p", "li", "td")
+# Blocks whose text is mostly link text are menus, link lists and "related articles"
+MAX_LINK_DENSITY = 0.5
+
+
+_html_tag = re.compile(r"<(!doctype|html|head|body|div|p|span|section|article|main|table|ul|ol|li|a|h[1-6])\b", re.IGNORECASE)
+
+
+def looks_like_html(content: str) -> bool:
+    """Whether content is HTML markup rather than already extracted plain text."""
+    return bool(content) and bool(_html_tag.search(content[:5000]))
+
+
+def main_content_ratio(main_text: str, full_text: str) -> float:
+    """Share of the full text kept by main-content extraction."""
+    return len(main_text) / len(full_text) if full_text else 1.0
+
+
+def _is_main_container(element, tag: str) -> bool:
+    return tag in ("main", "article") or (element.get("role") or "").lower() == "main"
+
+
+def _is_boilerplate(element, tag: str, in_main: bool) -> bool:
+    names = (element.get("class") or "").split() + (element.get("id") or "").split()
+    # Inside the main content class names describe content (card-footer, comment-count), not site chrome
+    if not in_main and any(_boilerplate_names.fullmatch(name) for name in names):
+        return True
+    # Content class names protect e.g. <aside class="product-details"> from the tag and role rules
+    if any(_content_names.search(name) for name in names):
+        return False
+    if (element.get("role") or "").lower() in BOILERPLATE_ROLES:
+        return True
+    # Article headers and footers carry titles and bylines, only the site's own are chrome
+    return tag in BOILERPLATE_TAGS and not (in_main and tag in ("header", "footer"))
+
+
+def _prune(body) -> list:
+    """
+    Find the boilerplate and link-list elements of a document in one walk.
+
+    Boilerplate is decided top-down when an element opens. Text, link text and element
+    counts are summed bottom-up when it closes, without the blocks already dropped below
+    it, so every element is visited twice regardless of nesting depth.
+    """
+    from lxml import etree
+
+    dropped = []
+    # Per open element: [text length, link text length, element count]
+    stack = []
+    main_depth = 0
+    skipped_depth = 0
+    for event, node in etree.iterwalk(body, events=("start", "end")):
+        tag = node.tag.lower() if isinstance(node.tag, str) else ""
+        if event == "start":
+            if skipped_depth:
+                skipped_depth += 1
+                continue
+            is_main = _is_main_container(node, tag)
+            if node is not body and not is_main and _is_boilerplate(node, tag, main_depth > 0):
+                dropped.append(node)
+                skipped_depth = 1
+                continue
+            main_depth += is_main
+            stack.append([len((node.text or "").strip()), 0, 0])
+            continue
+
+        tail_length = len((node.tail or "").strip())
+        if skipped_depth:
+            skipped_depth -= 1
+            # The tail of a dropped element stays in the parent
+            if not skipped_depth and stack:
+                stack[-1][0] += tail_length
+            continue
+        text_length, link_length, elements = stack.pop()
+        if tag == "a":
+            link_length = text_length
+        is_main = _is_main_container(node, tag)
+        main_depth -= is_main
+        # Link lists inside the main content are content, e.g. a linked feature list
+        drop = False
+        if tag in MAIN_CONTENT_BLOCK_TAGS and not is_main and not main_depth and text_length:
+            link_density = link_length / text_length
+            text_density = text_length / (elements + 1)
+            drop = link_density > MAX_LINK_DENSITY or (link_density > MAX_LINK_DENSITY / 2 and text_density < 15)
+        if drop:
+            dropped.append(node)
+        if stack:
+            parent = stack[-1]
+            parent[0] += tail_length
+            if not drop:
+                parent[0] += text_length
+                parent[1] += link_length
+                parent[2] += elements + 1
+    return dropped
+
+
+def extract_main_content(html: str) -> str:
+    """
+    Extract the main content of a page, dropping navigation, footers, cookie notices and link lists.
+
+    Boilerplate containers are removed by tag, ARIA role and class/id names, where names
+    only count outside the page's main or article containers. Every other block outside
+    those containers is scored by link density (share of its text inside links) and
+    text density (characters per element), and link-dense or sparse link-bearing blocks
+    are dropped. If the page marks up a main region holding most of the text, only that
+    region is kept.
+
+    Requires lxml, without it the full text is returned.
+
+    Args:
+        html (str): The HTML document.
+
+    Returns:
+        str: The main content text, in the same line layout as html_to_text.
+    """
+    if "lxml" not in available_backends():
+        return html_to_text(html)
+    from lxml import etree
+
+    if not html.strip():
+        return ""
+    root = _lxml_document(html)
+    etree.strip_elements(root, etree.Comment, etree.ProcessingInstruction, *SKIPPED_TAGS, with_tail=False)
+    body = root.find("body")
+    if body is None:
+        body = root
+    for element in _prune(body):
+        element.drop_tree()
+
+    text = _join_lines(_lxml_strings(body))
+    mains = body.xpath(".//main | .//*[@role='main']")
+    if mains:
+        main_text = _join_lines(_lxml_strings(mains[0]))
+        if len(main_text) >= 0.3 * len(text):
+            return main_text
+    return text
+
+
+html_text_backend = os.getenv("HTML_TEXT_BACKEND", "auto")
+_default_backend = None
@@ -0,0 +1,166 @@
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+from pyppeteer.errors import TimeoutError as NavigationTimeoutError
+
+from .disk_cache import DiskCache
+from .host_limiter import host_of
+
+DOMCONTENTLOADED = "domcontentloaded"
+LOAD = "load"
+NETWORKIDLE2 = "networkidle2"
+NETWORKIDLE0 = "networkidle0"
+TEXT_STABLE = "text_stable"
+
+# Ordered from most thorough to fastest, adaptive selection moves down this list on timeouts
+WAIT_STRATEGIES = (NETWORKIDLE0, NETWORKIDLE2, TEXT_STABLE, LOAD, DOMCONTENTLOADED)
+
+
+async def wait_for_text_stable(page, stable_ms: int = 1000, timeout_ms: int = 30000, poll_ms: int = 250) -> bool:
+    """
+    Wait until the length of the page's visible text stops changing.
+
+    Args:
+        page: The pyppeteer page.
+        stable_ms (int): How long the text length has to stay unchanged.
+        timeout_ms (int): Maximum time to wait.
+        poll_ms (int): Polling interval.
+
+    Returns:
+        bool: True if the text stabilised, False if the timeout was reached first.
+    """
+    deadline = time.monotonic() + timeout_ms / 1000
+    last_length = -1
+    stable_since = time.monotonic()
+    while time.monotonic() < deadline:
+        length = await page.evaluate('() => document.body ? document.body.innerText.length : 0')
+        now = time.monotonic()
+        if length != last_length:
+            last_length = length
+            stable_since = now
+        elif length > 0 and (now - stable_since) * 1000 >= stable_ms:
+            return True
+        await asyncio.sleep(poll_ms / 1000)
+    return False
+
+
+async def navigate(page, url: str, strategy: str = NETWORKIDLE0, timeout_ms: int = 30000, stable_ms: int = 1000) -> Tuple[Optional[object], bool]:
+    """
+    Navigate a page using the given wait strategy.
+
+    Timeouts are not raised: whatever has rendered so far stays on the page, and the main
+    document response is still returned if it arrived.
+
+    Args:
+        page: The pyppeteer page.
+        url (str): The URL to load.
+        strategy (str): One of WAIT_STRATEGIES.
+        timeout_ms (int): Navigation timeout.
+        stable_ms (int): Quiet period for the text_stable strategy.
+
+    Returns:
+        tuple: The main document response (or None) and whether the wait timed out.
+    """
+    if strategy not in WAIT_STRATEGIES:
+        raise ValueError(f"Unknown wait strategy: {strategy}")
+
+    # Remember the main document response so it survives a navigation timeout
+    document_responses = []
+
+    def on_response(response):
+        request = response.request
+        if request.isNavigationRequest() and request.frame == page.mainFrame:
+            document_responses.append(response)
+
+    page.on('response', on_response)
+    start = time.monotonic()
+    try:
+        wait_until = DOMCONTENTLOADED if strategy == TEXT_STABLE else strategy
+        response = await page.goto(url, {'waitUntil': wait_until, 'timeout': timeout_ms})
+        timed_out = False
+        if strategy == TEXT_STABLE:
+            remaining_ms = max(0, timeout_ms - int((time.monotonic() - start) * 1000))
+            timed_out = not await wait_for_text_stable(page, stable_ms, remaining_ms)
+    except NavigationTimeoutError:
+        print(f"navigation of {url[:100]} timed out waiting for {strategy}, keeping partial content")
+        response = document_responses[-1] if document_responses else None
+        timed_out = True
+    finally:
+        page.remove_listener('response', on_response)
+
+    return response, timed_out
+
+
+class _HostStrategy:
+    def __init__(self, strategy: str, promote_after: int):
+        self.strategy = strategy
+        self.promote_after = promote_after
+        self.clean_loads = 0
+        self.probing = False
+
+
+class WaitStrategyMemory:
+    """
+    Learns per domain which wait strategy to use.
+
+    Domains start with the most thorough strategy and are moved to the next faster one
+    every time a navigation times out, e.g. sites whose chat widgets or long-polling
+    connections never let the network go idle. After promote_after clean loads in a row
+    the next more thorough strategy is tried again, so one transient timeout does not
+    demote a domain for good. Every failed retry doubles the clean loads required before
+    the next one.
+    """
+
+    def __init__(self, default: str = NETWORKIDLE0, store: Optional[DiskCache] = None, ttl: float = 7 * 24 * 3600,
+                 promote_after: int = 5, max_promote_after: int = 80):
+        self.default = default
+        self.store = store
+        self.ttl = ttl
+        self.promote_after = promote_after
+        self.max_promote_after = max_promote_after
+        self._hosts: Dict[str, _HostStrategy] = {}
+
+    async def choose(self, url: str) -> str:
+        """Return the wait strategy to use for the URL's domain."""
+        host = host_of(url)
+        if host not in self._hosts:
+            state = _HostStrategy(self.default, self.promote_after)
+            if self.store is not None:
+                stored = await self.store.aget(f"wait:{host}")
+                if stored:
+                    state = _HostStrategy(stored["strategy"], stored.get("promote_after", self.promote_after))
+            # Domains without a stored strategy are remembered too, so the store is asked once per host
+            self._hosts.setdefault(host, state)
+        return self._hosts[host].strategy
+
+    async def record(self, url: str, strategy: str, timed_out: bool):
+        """Record the outcome of a navigation, demoting the domain's strategy on timeouts and promoting it again after clean loads."""
+        host = host_of(url)
+        state = self._hosts.get(host)
+        # Navigations started before the domain's strategy last changed say nothing about the current one
+        if state is None or strategy != state.strategy:
+            return
+        index = WAIT_STRATEGIES.index(strategy)
+        if timed_out:
+            if state.probing:
+                state.promote_after = min(state.promote_after * 2, self.max_promote_after)
+            state.clean_loads = 0
+            state.probing = False
+            if index + 1 >= len(WAIT_STRATEGIES):
+                return
+            state.strategy = WAIT_STRATEGIES[index + 1]
+            print(f"{host} timed out waiting for {strategy}, using {state.strategy} from now on")
+        else:
+            if state.probing:
+                state.probing = False
+                state.promote_after = self.promote_after
+            state.clean_loads += 1
+            if index <= WAIT_STRATEGIES.index(self.default) or state.clean_loads < state.promote_after:
+                return
+            state.strategy = WAIT_STRATEGIES[index - 1]
+            state.clean_loads = 0
+            state.probing = True
+            print(f"{host} loaded cleanly {state.promote_after} times with {strategy}, trying {state.strategy} again")
+        if self.store is not None:
+            await self.store.aset(f"wait:{host}", {"strategy": state.strategy, "promote_after": state.promote_after}, ttl=self.ttl)
@@ -0,0 +1,80 @@
+import hashlib
+import heapq
+import re
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Number of shingle hashes kept per fingerprint, the similarity estimate is accurate to about 1/sqrt of it
+FINGERPRINT_SIZE = 128
+# Fingerprints cover the start of the text, which is plenty to tell pages apart
+MAX_FINGERPRINT_CHARS = 200000
+
+_words = re.compile(r"\w+", re.UNICODE)
+
+
+def minhash(text: str, shingle_size: int = 3, min_words: int = 50, size: int = FINGERPRINT_SIZE) -> Optional[List[int]]:
+    """
+    Compute a bottom-k MinHash fingerprint over word shingles.
+
+    The fingerprint holds the smallest 64-bit hashes of the text's shingles, so the
+    share of shingles two texts have in common (their Jaccard similarity) can be
+    estimated from the fingerprints alone.
+
+    Args:
+        text (str): The extracted page text, ideally its main content without site chrome.
+        shingle_size (int): Number of consecutive words per shingle.
+        min_words (int): Shorter texts (error messages, empty shells) are not fingerprinted.
+        size (int): Number of hashes kept.
+
+    Returns:
+        list[int] | None: The fingerprint in ascending order, or None if the text is too short.
+    """
+    words = _words.findall((text or "")[:MAX_FINGERPRINT_CHARS].lower())
+    if len(words) < min_words:
+        return None
+    hashes = {
+        int.from_bytes(hashlib.blake2b(" ".join(words[i:i + shingle_size]).encode("utf-8"), digest_size=8).digest(), "big")
+        for i in range(len(words) - shingle_size + 1)
+    }
+    return heapq.nsmallest(size, hashes)
+
+
+def similarity(a: Sequence[int], b: Sequence[int]) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two fingerprints, 1.0 for identical ones."""
+    size = min(len(a), len(b))
+    if not size:
+        return 0.0
+    shared = set(a) & set(b)
+    # Among the smallest hashes of the union, the share present in both sets estimates the Jaccard similarity
+    return sum(1 for value in heapq.nsmallest(size, set(a) | set(b)) if value in shared) / size
+
+
+def fold_near_duplicates(items: Sequence[T], fingerprint: Callable[[T], Optional[Sequence[int]]], threshold: float) -> List[Tuple[T, List[T]]]:
+    """
+    Group items whose fingerprints are at least threshold similar.
+
+    Items are visited in order and each one is folded into the first kept item it is
+    similar to, so earlier (higher ranked) items are kept. Items without a fingerprint
+    are always kept.
+
+    Args:
+        items (Sequence): Items to group, e.g. search results.
+        fingerprint (Callable): Returns an item's fingerprint or None.
+        threshold (float): Minimum similarity for folding, see similarity().
+
+    Returns:
+        list: (kept item, folded items) pairs in the order of the kept items.
+    """
+    groups: List[Tuple[T, List[T]]] = []
+    kept_fingerprints: List[Tuple[int, Sequence[int]]] = []
+    for item in items:
+        value = fingerprint(item)
+        if value is not None:
+            match = next((index for index, kept in kept_fingerprints if similarity(value, kept) >= threshold), None)
+            if match is not None:
+                groups[match][1].append(item)
+                continue
+            kept_fingerprints.append((len(groups), value))
+        groups.append((item, []))
+    return groups
@@ -0,0 +1,215 @@
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# (position in the document, text, token count, relevance score)
+Passage = Tuple[int, str, int, float]
+
+GAP_MARKER = "[...]"
+
+_words = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it", "of",
+    "on", "or", "that", "the", "this", "to", "was", "what", "which", "who", "with", "vs", "versus",
+}
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """Return the tiktoken encoding used by the gpt-4o family, or None if tiktoken is unavailable."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            try:
+                _encoding = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"tiktoken unavailable, estimating 4 characters per token: {e}")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens of a text with tiktoken."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return -(-len(text) // 4)
+    return len(encoding.encode_ordinary(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut a text to at most max_tokens tokens."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode_ordinary(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def _terms(text: str) -> List[str]:
+    return [word for word in _words.findall(text.lower()) if word not in STOPWORDS]
+
+
+def split_passages(text: str, passage_tokens: int = 100) -> List[Tuple[str, int]]:
+    """
+    Split extracted text into passages of roughly passage_tokens tokens.
+
+    Consecutive lines are grouped until the next line would overflow the passage, lines
+    longer than a passage are split on word boundaries.
+
+    Returns:
+        list: (passage text, token count) pairs in document order.
+    """
+    pieces = []
+    max_chars = passage_tokens * 4
+    for line in text.splitlines():
+        line = line.strip()
+        while len(line) > max_chars:
+            cut = line.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(line[:cut])
+            line = line[cut:].strip()
+        if line:
+            pieces.append(line)
+
+    encoding = _get_encoding()
+    if encoding is None:
+        counts = [-(-len(piece) // 4) for piece in pieces]
+    else:
+        counts = [len(tokens) for tokens in encoding.encode_ordinary_batch(pieces)]
+
+    passages = []
+    current, current_tokens = [], 0
+    for piece, tokens in zip(pieces, counts):
+        if current and current_tokens + tokens > passage_tokens:
+            passages.append(("\n".join(current), current_tokens))
+            current, current_tokens = [], 0
+        current.append(piece)
+        # Joining lines adds one newline token at most
+        current_tokens += tokens + (1 if len(current) > 1 else 0)
+    if current:
+        passages.append(("\n".join(current), current_tokens))
+    return passages
+
+
+def bm25_scores(passages: Sequence[str], queries: Sequence[str], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """
+    Score passages against queries with BM25, taking each passage's best score over the queries.
+
+    Args:
+        passages (Sequence[str]): The passages, which also form the corpus for IDF.
+        queries (Sequence[str]): The search queries the passages should answer.
+        k1 (float): Term frequency saturation.
+        b (float): Length normalisation.
+
+    Returns:
+        np.ndarray: One score per passage.
+    """
+    scores = np.zeros(len(passages))
+    if not passages:
+        return scores
+    # Counter tallies in C, so the per-term work left in Python is one lookup per passage and query term
+    passage_counts = [Counter(_terms(passage)) for passage in passages]
+    lengths = np.array([sum(counts.values()) for counts in passage_counts], dtype=float)
+    norm = k1 * (1 - b + b * lengths / (lengths.mean() or 1))
+
+    vocabulary = sorted({term for query in queries for term in _terms(query or "")})
+    if not vocabulary:
+        return scores
+    index = {term: i for i, term in enumerate(vocabulary)}
+    tf_all = np.array([[counts[term] for term in vocabulary] for counts in passage_counts], dtype=float)
+
+    for query in queries:
+        columns = sorted({index[term] for term in _terms(query or "")})
+        if not columns:
+            continue
+        tf = tf_all[:, columns]
+        df = (tf > 0).sum(axis=0)
+        idf = np.log(1 + (len(passages) - df + 0.5) / (df + 0.5))
+        scores = np.maximum(scores, (tf * (k1 + 1) / (tf + norm[:, None])) @ idf)
+    return scores
+
+
+@lru_cache(maxsize=128)
+def score_passages(text: str, queries: Tuple[str, ...], passage_tokens: int = 100) -> Tuple[Passage, ...]:
+    """
+    Split a text into passages and score them against the queries.
+
+    A small positional prior breaks ties towards the top of the page, so without any
+    matching query term the selection falls back to document order.
+    """
+    passages = split_passages(text, passage_tokens)
+    scores = bm25_scores([passage for passage, _ in passages], queries)
+    return tuple(
+        (position, passage, tokens, float(score) + 1e-3 / (1 + position))
+        for position, ((passage, tokens), score) in enumerate(zip(passages, scores))
+    )
+
+
+def select_passages(
+    sources: Sequence[Tuple[str, Sequence[str]]],
+    max_tokens_per_source: int,
+    max_tokens_total: Optional[int] = None,
+    passage_tokens: int = 100,
+) -> List[str]:
+    """
+    Fill per-source and total token budgets with the most relevant passages.
+
+    Passages of all sources compete for the total budget by score, each source is
+    capped at max_tokens_per_source. Selected passages are returned in document order,
+    with a gap marker where passages were skipped.
+
+    Args:
+        sources (Sequence): (extracted text, originating queries) per source.
+        max_tokens_per_source (int): Token budget of each source.
+        max_tokens_total (int | None): Token budget of all sources together, None for no limit.
+        passage_tokens (int): Target passage size.
+
+    Returns:
+        List[str]: The selected text per source, each within its tiktoken-counted budget.
+    """
+    # Passages must be small enough that every source can get at least a few of them
+    passage_tokens = max(16, min(passage_tokens, max_tokens_per_source // 4))
+    scored = [score_passages(text or "", tuple(queries), passage_tokens) for text, queries in sources]
+    gap_tokens = count_tokens(f"\n{GAP_MARKER}\n")
+    candidates = sorted(
+        ((passage[3], source, passage) for source, passages in enumerate(scored) for passage in passages),
+        key=lambda candidate: (-candidate[0], candidate[1], candidate[2][0])
+    )
+
+    used = [0] * len(sources)
+    total = 0
+    chosen = [[] for _ in sources]
+    for _, source, passage in candidates:
+        # Reserve room for the separator in front of every passage
+        cost = passage[2] + gap_tokens
+        if used[source] + cost > max_tokens_per_source:
+            continue
+        if max_tokens_total is not None and total + cost > max_tokens_total:
+            continue
+        used[source] += cost
+        total += cost
+        chosen[source].append(passage)
+
+    selected = []
+    for source, passages in enumerate(chosen):
+        parts = []
+        last_position = -1
+        for position, passage, _, _ in sorted(passages):
+            if position != last_position + 1:
+                parts.append(GAP_MARKER)
+            parts.append(passage)
+            last_position = position
+        if chosen[source] and last_position != len(scored[source]) - 1:
+            parts.append(GAP_MARKER)
+        selected.append(truncate_to_tokens("\n".join(parts), max_tokens_per_source))
+    return selected
@@ -0,0 +1,59 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+# CPU-bound work (image processing, HTML parsing) runs here so it never blocks the event loop
+process_pool_workers = int(os.getenv("PROCESS_POOL_WORKERS", os.cpu_count() or 2))
+# Forking a process that already runs threads is unsafe, so workers are spawned by default
+process_pool_start_method = os.getenv("PROCESS_POOL_START_METHOD", "spawn")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Return the shared process pool, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=process_pool_workers,
+                mp_context=multiprocessing.get_context(process_pool_start_method)
+            )
+    return _executor
+
+
+def _reset_process_pool(broken: ProcessPoolExecutor):
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+
+async def run_in_process(fn, *args, **kwargs):
+    """
+    Run a picklable function in the shared process pool and await its result.
+
+    If the pool broke (e.g. a worker was killed) it is replaced and the call retried once.
+
+    Args:
+        fn (Callable): Module-level function to run.
+        *args, **kwargs: Arguments passed to fn, must be picklable.
+
+    Returns:
+        Any: The return value of fn.
+    """
+    loop = asyncio.get_running_loop()
+    call = partial(fn, *args, **kwargs)
+    executor = get_process_pool()
+    try:
+        return await loop.run_in_executor(executor, call)
+    except BrokenProcessPool:
+        print("process pool broke, restarting it")
+        _reset_process_pool(executor)
+        return await loop.run_in_executor(get_process_pool(), call)
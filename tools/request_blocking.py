@@ -0,0 +1,99 @@
+import asyncio
+import os
+from collections import Counter
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+# Ad, analytics and tracking hosts that never contribute content we scrape
+DEFAULT_BLOCKED_DOMAINS = {
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com", "google-analytics.com",
+    "googletagmanager.com", "googletagservices.com", "adservice.google.com", "facebook.net",
+    "connect.facebook.net", "ads-twitter.com", "analytics.twitter.com", "snap.licdn.com",
+    "bat.bing.com", "clarity.ms", "hotjar.com", "fullstory.com", "mixpanel.com", "amplitude.com",
+    "segment.io", "cdn.segment.com", "heapanalytics.com", "optimizely.com", "crazyegg.com",
+    "mouseflow.com", "quantserve.com", "scorecardresearch.com", "criteo.com", "criteo.net",
+    "taboola.com", "outbrain.com", "adnxs.com", "adsrvr.org", "rubiconproject.com", "pubmatic.com",
+    "js-agent.newrelic.com", "bam.nr-data.net", "hs-analytics.net", "hs-banner.com",
+    "intercomcdn.com", "widget.intercom.io", "js.driftt.com", "cookielaw.org", "cookiebot.com",
+}
+
+DEFAULT_BLOCKED_RESOURCE_TYPES = {"media", "font"}
+
+
+class RequestBlockingPolicy:
+    """
+    Request interception policy for rendered pages.
+
+    Aborts requests for heavy resource types (media and fonts, optionally images) and
+    for known ad/tracker hosts, and counts what was blocked by reason.
+    """
+
+    def __init__(self, blocked_resource_types: Iterable[str] = DEFAULT_BLOCKED_RESOURCE_TYPES, blocked_domains: Iterable[str] = DEFAULT_BLOCKED_DOMAINS):
+        self.blocked_resource_types = set(blocked_resource_types)
+        self.blocked_domains = set(blocked_domains)
+        self.blocked = Counter()
+        self.allowed = 0
+
+    def _blocked_domain(self, url: str) -> Optional[str]:
+        host = (urlsplit(url).hostname or "").lower()
+        parts = host.split(".")
+        for i in range(len(parts) - 1):
+            candidate = ".".join(parts[i:])
+            if candidate in self.blocked_domains:
+                return candidate
+        return None
+
+    def block_reason(self, url: str, resource_type: str, block_images: bool = False) -> Optional[str]:
+        """
+        Decide whether a request should be aborted.
+
+        Args:
+            url (str): The requested URL.
+            resource_type (str): The DevTools resource type (document, image, media, font, ...).
+            block_images (bool): Whether images should be blocked as well.
+
+        Returns:
+            str | None: The reason for blocking, or None if the request may proceed.
+        """
+        if resource_type == "document":
+            return None
+        if resource_type in self.blocked_resource_types or (block_images and resource_type == "image"):
+            return f"type:{resource_type}"
+        domain = self._blocked_domain(url)
+        if domain:
+            return f"domain:{domain}"
+        return None
+
+    async def attach(self, page, block_images: bool = False):
+        """Enable request interception on a page and apply this policy to every request."""
+        await page.setRequestInterception(True)
+
+        def on_request(request):
+            reason = self.block_reason(request.url, request.resourceType, block_images)
+            if reason:
+                self.blocked[reason] += 1
+                asyncio.ensure_future(self._resolve(request.abort()))
+            else:
+                self.allowed += 1
+                asyncio.ensure_future(self._resolve(request.continue_()))
+
+        page.on('request', on_request)
+
+    @staticmethod
+    async def _resolve(action):
+        try:
+            await action
+        except Exception as e:
+            # Requests of closed pages or already handled requests cannot be resolved any more
+            print(f"Error resolving intercepted request: {e}")
+
+    def stats(self) -> dict:
+        """Return the number of allowed requests and blocked requests by reason."""
+        return {"allowed": self.allowed, "blocked": sum(self.blocked.values()), "blocked_by_reason": dict(self.blocked)}
+
+
+request_blocking_enabled = os.getenv("REQUEST_BLOCKING_ENABLED", "true").lower() not in ("0", "false", "no")
+default_request_blocking_policy = RequestBlockingPolicy(
+    blocked_resource_types=[t.strip() for t in os.getenv("BLOCKED_RESOURCE_TYPES", ",".join(sorted(DEFAULT_BLOCKED_RESOURCE_TYPES))).split(",") if t.strip()],
+    blocked_domains=DEFAULT_BLOCKED_DOMAINS | {d.strip().lower() for d in os.getenv("BLOCKED_REQUEST_DOMAINS", "").split(",") if d.strip()},
+)
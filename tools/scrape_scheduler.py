@@ -0,0 +1,89 @@
+import asyncio
+import os
+import weakref
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+# The (per-call, global) semaphores of the scheduled job running in the current task
+_job_window: ContextVar[Optional[Tuple[asyncio.Semaphore, asyncio.Semaphore]]] = ContextVar("scrape_job_window", default=None)
+
+
+class ScrapeScheduler:
+    """
+    Runs scrape jobs with a sliding window of concurrency.
+
+    A new request starts as soon as any running one finishes, instead of waiting for a
+    whole batch. Concurrency is bounded both globally (shared by every caller in the
+    process) and per call, and results are returned in input order.
+
+    Jobs take their window slot with window() only around the request itself, after
+    their host is ready, so jobs waiting for a paused or busy host never hold slots that
+    requests to other hosts could use.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max(1, max_concurrency)
+        # asyncio primitives are bound to a loop, so keep one global semaphore per loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _global_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def map(self, job: Callable[[Any], Awaitable[Any]], items: List[Any], concurrency: Optional[int] = None) -> List[Any]:
+        """
+        Apply an async job to every item, keeping up to `concurrency` jobs in flight.
+
+        Args:
+            job (Callable): Coroutine function called with each item.
+            items (list): The items to process.
+            concurrency (int, optional): Per-call limit, capped by the global limit.
+
+        Returns:
+            list: The job results in the same order as items.
+        """
+        if not items:
+            return []
+        global_semaphore = self._global_semaphore()
+        call_semaphore = asyncio.Semaphore(max(1, concurrency or self.max_concurrency))
+
+        async def run(index, item):
+            # Every task runs in its own context copy, so this only applies to this job
+            _job_window.set((call_semaphore, global_semaphore))
+            return index, await job(item)
+
+        results = [None] * len(items)
+        tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+        try:
+            for done, completed in enumerate(asyncio.as_completed(tasks), 1):
+                index, result = await completed
+                results[index] = result
+                print(f"completed {done}/{len(items)} scrape jobs")
+        finally:
+            for task in tasks:
+                task.cancel()
+        return results
+
+    @asynccontextmanager
+    async def window(self):
+        """
+        Hold a window slot for a request of the job running in the current task.
+
+        Outside a job started by map() this does not limit anything.
+        """
+        semaphores = _job_window.get()
+        if semaphores is None:
+            yield
+            return
+        call_semaphore, global_semaphore = semaphores
+        async with call_semaphore:
+            async with global_semaphore:
+                yield
+
+
+scrape_scheduler = ScrapeScheduler(int(os.getenv("SCRAPE_CONCURRENCY", 6)))
@@ -0,0 +1,102 @@
+import asyncio
+import atexit
+import concurrent.futures
+import os
+import threading
+from typing import Any, Awaitable, Callable
+
+from .browser_manager import BrowserManager
+
+
+class ScrapeService:
+    """
+    Long-lived background thread with its own event loop that owns the browser pool.
+
+    Callers on any event loop (each Streamlit click runs its own asyncio.run) or on plain
+    threads submit scrape coroutines to it, so one warm browser pool is shared safely
+    without binding browser state to the caller's loop.
+    """
+
+    def __init__(self, warm_up: bool = True):
+        self.warm_up_on_start = warm_up
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the service thread if it is not running yet."""
+        with self._lock:
+            if self.running:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name="scrape-service", daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+            print("scrape service started")
+        if self.warm_up_on_start:
+            self.warm_up()
+
+    def warm_up(self):
+        """Launch the browser in the background without waiting for it."""
+        self.submit(BrowserManager.warm_up)
+
+    def _on_service_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def submit(self, coro_fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Schedule a coroutine function on the service loop.
+
+        Args:
+            coro_fn (Callable): Coroutine function to run.
+            *args, **kwargs: Arguments passed to coro_fn.
+
+        Returns:
+            concurrent.futures.Future: Future resolving to the coroutine's result.
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro_fn(*args, **kwargs), self._loop)
+
+    async def run(self, coro_fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Run a coroutine function on the service loop and await it from any other loop."""
+        if self._on_service_loop():
+            return await coro_fn(*args, **kwargs)
+        return await asyncio.wrap_future(self.submit(coro_fn, *args, **kwargs))
+
+    def run_sync(self, coro_fn: Callable[..., Awaitable[Any]], *args, timeout: float = None, **kwargs) -> Any:
+        """Run a coroutine function on the service loop and block the calling thread until it is done."""
+        if self._on_service_loop():
+            raise RuntimeError("run_sync cannot be called from the scrape service loop, use run instead")
+        return self.submit(coro_fn, *args, **kwargs).result(timeout)
+
+    def stop(self, timeout: float = 10):
+        """Close the browser pool and stop the service thread."""
+        with self._lock:
+            if not self.running:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(BrowserManager.close_browser(), self._loop).result(timeout)
+            except Exception as e:
+                print(f"Error closing browsers of the scrape service: {e}")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout)
+            self._thread = None
+
+
+scrape_service = ScrapeService(warm_up=os.getenv("SCRAPE_SERVICE_WARM_UP", "true").lower() not in ("0", "false", "no"))
+atexit.register(scrape_service.stop)
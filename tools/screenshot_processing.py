@@ -0,0 +1,98 @@
+import base64
+import io
+from typing import List
+
+from PIL import Image
+
+SEGMENT_HEIGHT = 1500
+DOWNSCALE_FACTOR = 3
+
+_mime_types = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def encode_segment(segment: Image.Image, image_format: str = "jpeg", quality: int = 70) -> str:
+    """
+    Encode an image as a base64 data URL.
+
+    Args:
+        segment (Image.Image): The image to encode.
+        image_format (str): One of png, jpeg or webp.
+        quality (int): Quality for the lossy formats (1-100).
+
+    Returns:
+        str: The data URL.
+    """
+    image_format = image_format.lower()
+    if image_format not in _mime_types:
+        raise ValueError(f"Unsupported screenshot format: {image_format}")
+    if image_format == "jpeg" and segment.mode != "RGB":
+        segment = segment.convert("RGB")
+
+    options = {} if image_format == "png" else {"quality": quality}
+    segment_bytes = io.BytesIO()
+    segment.save(segment_bytes, format=image_format.upper(), **options)
+    b64_data = base64.b64encode(segment_bytes.getvalue()).decode('utf-8')
+    return f"data:{_mime_types[image_format]};base64,{b64_data}"
+
+
+def split_screenshot(screenshot_bytes: bytes, max_segments: int = 5, image_format: str = "jpeg", quality: int = 70) -> List[str]:
+    """
+    Split a full-page screenshot into downscaled segments.
+
+    Runs in the process pool, so it only takes and returns picklable values. Segments
+    beyond max_segments are never cropped or encoded.
+
+    Args:
+        screenshot_bytes (bytes): The encoded full-page screenshot.
+        max_segments (int): Maximum number of segments to produce, from the top of the page.
+        image_format (str): Output format, one of png, jpeg or webp.
+        quality (int): Quality for the lossy formats.
+
+    Returns:
+        list[str]: Base64 data URLs of the segments.
+    """
+    img = Image.open(io.BytesIO(screenshot_bytes))
+    width, height = img.size
+
+    # Calculate number of segments needed
+    num_segments = min(-(-height // SEGMENT_HEIGHT), max_segments)  # Ceiling division
+
+    segments = []
+    for i in range(num_segments):
+        start_y = i * SEGMENT_HEIGHT
+        end_y = min(start_y + SEGMENT_HEIGHT, height)
+
+        # Crop the segment and reduce its resolution
+        segment = img.crop((0, start_y, width, end_y))
+        segment = segment.resize(
+            (width // DOWNSCALE_FACTOR, max(1, (end_y - start_y) // DOWNSCALE_FACTOR)),
+            Image.Resampling.LANCZOS
+        )
+        segments.append(encode_segment(segment, image_format, quality))
+
+    return segments
+
+
+def process_segment(screenshot_bytes: bytes, crop_top: int = 0, image_format: str = "jpeg", quality: int = 70) -> str:
+    """
+    Downscale and encode a single viewport-sized screenshot segment.
+
+    Args:
+        screenshot_bytes (bytes): The encoded viewport screenshot.
+        crop_top (int): Pixels to drop from the top, used when the last segment overlaps the previous one.
+        image_format (str): Output format, one of png, jpeg or webp.
+        quality (int): Quality for the lossy formats.
+
+    Returns:
+        str: Base64 data URL of the segment.
+    """
+    segment = Image.open(io.BytesIO(screenshot_bytes))
+    width, height = segment.size
+    if 0 < crop_top < height:
+        segment = segment.crop((0, crop_top, width, height))
+        height -= crop_top
+    segment = segment.resize(
+        (width // DOWNSCALE_FACTOR, max(1, height // DOWNSCALE_FACTOR)),
+        Image.Resampling.LANCZOS
+    )
+    return encode_segment(segment, image_format, quality)
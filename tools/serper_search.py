@@ -2,26 +2,237 @@ import requests
 import json
 import asyncio
 import aiohttp
-from bs4 import BeautifulSoup
 from langsmith import traceable
 from typing import List, Union, Dict
 import os
-from PIL import Image
-import io
-import base64
-import signal
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
-from .browser_manager import BrowserManager
+from .browser_manager import BrowserManager, BrowserCrashedError
+from .disk_cache import DiskCache
+from .scrape_scheduler import scrape_scheduler
+from .host_limiter import host_limiter, parse_retry_after
+from .fetch_tiers import TierMemory, HTTP_TIER, RENDER_TIER, looks_like_js_shell
+from .process_pool import run_in_process
+from .navigation import WaitStrategyMemory, navigate
+from .screenshot_processing import SEGMENT_HEIGHT, split_screenshot, process_segment
+from .scrape_service import scrape_service
+from .dom_extraction import extract_in_browser
+from .html_text import html_to_text, extract_main_content, looks_like_html, main_content_ratio
+from .single_flight import SingleFlight
+from .url_canonicalization import canonicalize_url, learned_canonical
+from .near_duplicates import minhash, fold_near_duplicates
+from .passage_selection import select_passages, truncate_to_tokens
 
 serper_api_key = os.getenv("SERPER_API_KEY")
 scrapingant_api_key = os.getenv("SCRAPINGANT_API_KEY")
 
+# Rendered pages are cached on disk so repeat visits skip the network and the browser
+page_cache_enabled = os.getenv("PAGE_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+page_cache = DiskCache(
+    os.path.join(os.getenv("SCRAPE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "business-analysis-toolkit")), "pages.sqlite"),
+    default_ttl=float(os.getenv("PAGE_CACHE_TTL", 24 * 3600)),
+    max_bytes=int(os.getenv("PAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024)),
+)
+
+# Serper responses are cached per normalized query, repeated and overlapping runs reuse them
+serper_search_url = "https://google.serper.dev/search"
+query_cache_enabled = os.getenv("QUERY_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+query_cache = DiskCache(
+    os.path.join(os.getenv("SCRAPE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "business-analysis-toolkit")), "queries.sqlite"),
+    default_ttl=float(os.getenv("QUERY_CACHE_TTL", 6 * 3600)),
+    max_bytes=int(os.getenv("QUERY_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+)
+
 class ScrapingError(Exception):
     """Exception raised for errors during scraping."""
     def __init__(self, message="Scraping failed"):
         self.message = message
         super().__init__(self.message)
 
+class ThrottledError(ScrapingError):
+    """Exception raised when a host answers with 429 or 503."""
+    def __init__(self, message="Throttled by host", retry_after=None):
+        self.retry_after = retry_after
+        super().__init__(message)
+
+# Throttled pages are retried while the requested Retry-After stays reasonable
+max_throttle_retries = int(os.getenv("SCRAPE_THROTTLE_RETRIES", 2))
+max_retry_after = float(os.getenv("SCRAPE_MAX_RETRY_AFTER", 60))
+# Pages on a browser that crashed or hung past the deadline are retried on another browser of the pool
+browser_crash_retries = int(os.getenv("BROWSER_CRASH_RETRIES", 1))
+render_deadline = float(os.getenv("RENDER_DEADLINE", 90))
+
+# Screenshot segments beyond what deduplicate_and_format_sources sends to the LLM are never produced
+max_screenshot_segments = int(os.getenv("MAX_SCREENSHOT_SEGMENTS", 5))
+screenshot_format = os.getenv("SCREENSHOT_FORMAT", "jpeg")
+screenshot_quality = int(os.getenv("SCREENSHOT_QUALITY", 70))
+# "clip" captures one viewport-sized segment at a time, "full" takes one full-page screenshot and crops it
+screenshot_capture_mode = os.getenv("SCREENSHOT_CAPTURE_MODE", "clip")
+
+# "adaptive" learns a wait strategy per domain, otherwise one of navigation.WAIT_STRATEGIES is used everywhere
+navigation_wait_strategy = os.getenv("NAVIGATION_WAIT_STRATEGY", "adaptive")
+navigation_timeout_ms = int(os.getenv("NAVIGATION_TIMEOUT_MS", 30000))
+text_stable_ms = int(os.getenv("TEXT_STABLE_MS", 1000))
+wait_strategy_memory = WaitStrategyMemory(store=page_cache if page_cache_enabled else None)
+
+# Formatted source blocks by (url, max_tokens_per_source, images_per_source, include_raw_content), least recently used first
+formatted_source_memo_size = int(os.getenv("FORMATTED_SOURCE_MEMO_SIZE", 1024))
+_formatted_source_memo = OrderedDict()
+_formatted_source_memo_lock = threading.Lock()
+# Selected passages by (sources with their text and queries, budgets, main_content), least recently used first.
+# Checked before passages are scored, which is the expensive part of formatting.
+passage_selection_memo_size = int(os.getenv("PASSAGE_SELECTION_MEMO_SIZE", 256))
+_passage_selection_memo = OrderedDict()
+
+# Dedup sets, cache keys and in-flight scrapes use canonical URLs, pages are fetched with the original one.
+# A page's rel=canonical link is only followed when deduplicating formatted sources.
+learn_rel_canonical = os.getenv("LEARN_REL_CANONICAL", "true").lower() not in ("0", "false", "no")
+
+# Sources whose texts share at least this estimated share of word shingles are sent to the LLM once, 0 disables folding.
+# Copies of one article with a few edits score about 0.8 on their main content, rewrites 0.5-0.6, unrelated pages below 0.05.
+near_duplicate_threshold = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", 0.7))
+near_duplicate_min_words = int(os.getenv("NEAR_DUPLICATE_MIN_WORDS", 50))
+
+# Token budget for the text of all sources in one prompt, 0 for no limit beyond the per-source one
+max_source_tokens_per_prompt = int(os.getenv("MAX_SOURCE_TOKENS_PER_PROMPT", 30000)) or None
+
+# Concurrent scrapes of the same page, e.g. from parallel competitor branches, share one fetch
+scrape_flights = SingleFlight()
+
+# Extract text and prune the HTML inside Chromium instead of serialising the full document
+in_browser_extraction = os.getenv("IN_BROWSER_EXTRACTION", "true").lower() not in ("0", "false", "no")
+
+# Realistic browser headers for plain HTTP fetches
+browser_headers = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    # Brotli decoding needs an optional package in both requests and aiohttp, so it is not advertised
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+    "Referer": "https://www.google.com/",
+}
+
+# Plain HTTP fetches are tried before rendering, remembering per domain which tier worked
+http_fetch_timeout = float(os.getenv("HTTP_FETCH_TIMEOUT", 10))
+http_fetch_max_bytes = int(os.getenv("HTTP_FETCH_MAX_BYTES", 5 * 1024 * 1024))
+tier_memory = TierMemory(page_cache if page_cache_enabled else None)
+
+# The synchronous search path scrapes on a thread pool sharing one pooled requests session
+sync_scrape_workers = int(os.getenv("SYNC_SCRAPE_WORKERS", 8))
+_http_session = None
+_http_session_lock = threading.Lock()
+_scrape_executor = ThreadPoolExecutor(max_workers=sync_scrape_workers, thread_name_prefix="scrape")
+
+def _get_http_session() -> requests.Session:
+    """Return the process-wide requests session, creating it on first use."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=sync_scrape_workers, pool_maxsize=sync_scrape_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(browser_headers)
+            _http_session = session
+    return _http_session
+
+def _annotate_result(url: str, result: dict, text_fingerprint: Union[List[int], None]):
+    """Store the canonical key (following the page's rel=canonical) and the text fingerprint in the result's metadata."""
+    metadata = result["metadata"]
+    if learn_rel_canonical:
+        metadata["canonical_url"] = learned_canonical(url, result.get("raw_content") or "", base_url=metadata.get("final_url"))
+    else:
+        metadata["canonical_url"] = canonicalize_url(url)
+    metadata["minhash"] = text_fingerprint
+
+def _source_key(source: dict) -> str:
+    """Dedup key of a formatted source, the canonical key stored at scrape time if there is one."""
+    return (source.get('metadata') or {}).get('canonical_url') or canonicalize_url(source['url'])
+
+async def _fingerprint_async(text: str) -> Union[List[int], None]:
+    """Compute the MinHash fingerprint of a text in the process pool."""
+    return await run_in_process(minhash, text or "", min_words=near_duplicate_min_words)
+
+def _query_cache_key(payload: dict) -> str:
+    """Cache key for a Serper request, ignoring case and whitespace differences in the query."""
+    normalized = {key: " ".join(value.lower().split()) if key == "q" else value for key, value in payload.items()}
+    return f"query:{json.dumps(normalized, sort_keys=True)}"
+
+def _cacheable_search_result(search_results) -> bool:
+    # Errors and quota messages come back without organic results and must not be cached
+    return isinstance(search_results, dict) and "organic" in search_results
+
+async def _serper_batch_search(queries_payload: List[dict]) -> List[dict]:
+    """
+    Run a batch of Serper queries, sending only cache misses in the batched POST.
+
+    Args:
+        queries_payload (List[dict]): Serper request bodies, e.g. {"q": "..."}.
+
+    Returns:
+        List[dict]: One Serper response per request body, in input order.
+    """
+    search_results = [None] * len(queries_payload)
+    # Identical queries in one batch are only sent once
+    misses = {}
+    for i, payload in enumerate(queries_payload):
+        key = _query_cache_key(payload)
+        cached = await query_cache.aget(key) if query_cache_enabled and key not in misses else None
+        if cached is not None:
+            search_results[i] = cached
+        else:
+            misses.setdefault(key, []).append(i)
+    print(f"serper query cache: {len(queries_payload) - sum(len(indices) for indices in misses.values())} hits, {len(misses)} queries to send")
+
+    if misses:
+        headers = {
+            'x-api-key': serper_api_key,
+            'Content-Type': 'application/json'
+        }
+        miss_payload = [queries_payload[indices[0]] for indices in misses.values()]
+        async with aiohttp.ClientSession() as session:
+            async with session.post(serper_search_url, headers=headers, data=json.dumps(miss_payload)) as response:
+                fetched = await response.json()
+        if not isinstance(fetched, list):
+            print(f"Unexpected Serper response: {str(fetched)[:200]}")
+            fetched = [{}] * len(miss_payload)
+
+        for (key, indices), result in zip(misses.items(), fetched):
+            for i in indices:
+                search_results[i] = result
+            if query_cache_enabled and _cacheable_search_result(result):
+                await query_cache.aset(key, result)
+
+    return [result if result is not None else {} for result in search_results]
+
+def _page_cache_key(url: str) -> str:
+    return f"page:{canonicalize_url(url)}"
+
+async def _get_cached_page(url: str, require_render: bool = False, require_screenshots: bool = False) -> Union[dict, None]:
+    """Return a cached scrape result for the URL, or None on a miss."""
+    if not page_cache_enabled:
+        return None
+    cached = await page_cache.aget(_page_cache_key(url))
+    if not cached:
+        return None
+    metadata = cached.get("metadata", {})
+    if require_render and metadata.get("renderer") != "chromium":
+        return None
+    if require_screenshots and not metadata.get("has_screenshots", bool(cached.get("screenshot_segments"))):
+        return None
+    print("page cache hit for", url[:100])
+    return cached
+
+async def _cache_page(url: str, result: dict):
+    """Store a successful scrape result in the page cache."""
+    if page_cache_enabled:
+        await page_cache.aset(_page_cache_key(url), result)
+
 def scrape_url(url: str) -> dict:
     """
     Fetches the raw content of a URL using realistic browser headers and session.
@@ -32,110 +243,140 @@ def scrape_url(url: str) -> dict:
     Returns:
         dict: A dictionary containing the raw content of the response.
     """
-    # Define realistic browser headers
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive",
-        "Referer": "https://www.google.com/",
-    }
-    
-    # Use a session to maintain cookies and connection
-    session = requests.Session()
-    session.chromium_path = os.getenv("CHROMIUM_PATH")
-    session.headers.update(headers)
-    
+    if page_cache_enabled:
+        cached = page_cache.get(_page_cache_key(url))
+        if cached:
+            print("page cache hit for", url[:100])
+            return cached
+
     try:
-        # Fetch the URL
-        response = session.get(url, timeout=10)
+        # Fetch the URL over the shared keep-alive session
+        response = _get_http_session().get(url, timeout=http_fetch_timeout)
         print("received response with length", len(response.text))
         response.raise_for_status()  # Raise HTTPError for bad responses
-        return {"raw_content": response.text}
+        result = {
+            "raw_content": response.text,
+            "text_content": extract_text_from_html(response.text),
+            "metadata": {
+                "status": response.status_code,
+                "final_url": response.url,
+                "fetched_at": time.time(),
+                "renderer": "http",
+            },
+        }
+        _annotate_result(url, result, minhash(result["text_content"] or "", min_words=near_duplicate_min_words))
+        if page_cache_enabled:
+            page_cache.set(_page_cache_key(url), result)
+        return result
     except requests.RequestException as e:
         return {"raw_content": f"Error fetching the URL: {e}"}
 
-async def scrape_url_with_render(url: str) -> dict:
+async def scrape_url_with_render(url: str, include_images: bool = True) -> dict:
     """
     Fetches the raw content of a URL using pyppeteer with JavaScript rendering support.
+    The page is only screenshotted when include_images is set.
+
+    Requests are subject to the per-host politeness limits of host_limiter, and pages
+    that come back throttled are retried after the host's Retry-After delay. Pages whose
+    browser crashed or hung are retried on another browser of the pool. Concurrent calls
+    for the same page share one render.
     """
+    key = canonicalize_url(url)
+    # A render that captures screenshots also serves callers that do not need them
+    pending = scrape_flights.pending((RENDER_TIER, key, True)) if not include_images else None
+    if pending is not None:
+        print(f"joining in-flight render of {url[:100]}")
+        return await scrape_flights.join(pending)
+    return await scrape_flights.run((RENDER_TIER, key, include_images), _scrape_url_with_render, url, include_images)
+
+async def _scrape_url_with_render(url: str, include_images: bool) -> dict:
     print("scraping ", url[:100])
-    
+
+    cached = await _get_cached_page(url, require_render=True, require_screenshots=include_images)
+    if cached:
+        return cached
+
+    throttle_attempts = 0
+    crash_attempts = 0
+    while True:
+        try:
+            async with host_limiter.slot(url), scrape_scheduler.window():
+                result = await asyncio.wait_for(_render_page(url, include_images), render_deadline)
+        except ThrottledError as e:
+            throttle_attempts += 1
+            delay = host_limiter.record_throttle(url, e.retry_after)
+            if throttle_attempts > max_throttle_retries or (e.retry_after or 0) > max_retry_after:
+                print(f"Giving up on throttled page {url} after {throttle_attempts} attempts")
+                return {"raw_content": "Failed to scrape page"}
+            print(f"retrying {url} in {delay:.1f}s")
+            continue
+        except (BrowserCrashedError, asyncio.TimeoutError) as e:
+            # The browser crashed or hung, the pool replaces it and the page is retried on a healthy one
+            crash_attempts += 1
+            if crash_attempts > browser_crash_retries:
+                print(f"Giving up on {url} after {crash_attempts} browser failures")
+                return {"raw_content": f"Error processing the page: {str(e) or 'browser did not respond'}"}
+            print(f"browser failed while scraping {url}, retrying on a healthy browser")
+            continue
+        if "metadata" in result:
+            host_limiter.record_success(url)
+            _annotate_result(url, result, await _fingerprint_async(result.get("text_content")))
+            # Pages cut off by a navigation timeout are returned but not cached
+            if not result["metadata"].get("partial"):
+                await _cache_page(url, result)
+        return result
+
+async def _render_page(url: str, include_images: bool = True) -> dict:
+    """Render a single page on the browser pool. Raises ThrottledError on 429/503 and BrowserCrashedError if the browser died."""
     try:
-        # Add signal handling workaround for non-main threads
-        signal.signal = lambda *args: None
-        
-        async with BrowserManager.get_page(url) as page:
+        # Images are only needed for screenshots, everything else heavy is blocked by default
+        async with BrowserManager.get_page(url, block_images=not include_images) as page:
             try:
-                # Set timeout and other options
+                # Navigate to the page, keeping whatever rendered if the wait times out
+                strategy = await wait_strategy_memory.choose(url) if navigation_wait_strategy == "adaptive" else navigation_wait_strategy
+                response, timed_out = await navigate(page, url, strategy, navigation_timeout_ms, text_stable_ms)
+                if navigation_wait_strategy == "adaptive":
+                    await wait_strategy_memory.record(url, strategy, timed_out)
+                print(f"received response from {url} with status", response.status if response else None)
                 
-                page.setDefaultNavigationTimeout(30000)
-                print("set timeout")
+                if response and response.status in (429, 503):
+                    raise ThrottledError(
+                        f"Throttled loading page {url}: {response.status}",
+                        retry_after=parse_retry_after(response.headers.get('retry-after'))
+                    )
 
-                # Navigate to the page
-                response = await page.goto(url, {
-                    'waitUntil': 'networkidle0',
-                    'timeout': 30000
-                })
-                print(f"received response from {url} with status", response.status)
-                
                 if not response or not response.ok:
                     print(f"Failed to load page {url}: {response.status if response else 'No response'}")
                     raise ScrapingError(f"Failed to load page {url}: {response.status if response else 'No response'}")
 
-                content = await page.content()
+                if in_browser_extraction:
+                    text_content, content = await extract_in_browser(page)
+                else:
+                    content = await page.content()
+                    text_content = await extract_text_from_html_async(content)
                 print("received content with length", len(content))
-               
-                
-                # Take one full screenshot into memory
-                screenshot_bytes = await page.screenshot({
-                    'fullPage': True,
-                    'type': 'png'
-                })
-                
-                # Open the screenshot with PIL
-                img = Image.open(io.BytesIO(screenshot_bytes))
-                width, height = img.size
-                
-                # Calculate number of segments needed
-                segment_height = 1500
-                num_segments = -(-height // segment_height)  # Ceiling division
-                
-                # Split into segments
-                segments = []
-                for i in range(num_segments):
-                    start_y = i * segment_height
-                    end_y = min(start_y + segment_height, height)
-                    
-                    # Crop the segment
-                    segment = img.crop((0, start_y, width, end_y))
-                    
-                    # Resize the segment to reduce resolution
-                    new_width = width // 3  # Reduce width by same factor as height (1500 -> 500)
-                    new_height = segment_height // 3
-                    segment = segment.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    
-                    # Convert segment to bytes
-                    segment_bytes = io.BytesIO()
-                    segment.save(segment_bytes, format='PNG')
-                    segments.append(segment_bytes.getvalue())
-                
-                print(f"received {len(segments)} segments")
-                # Convert segments to base64
-                base64_segments = []
-                for segment_bytes in segments:
-                    # Convert bytes to base64
-                    b64_data = base64.b64encode(segment_bytes).decode('utf-8')
-                    base64_segments.append(f"data:image/png;base64,{b64_data}")
-                
                 
-                
-                print("received response with length", len(content))
-                return {
+                # Screenshots are only captured when the caller will use them
+                base64_segments = await _capture_screenshot_segments(page) if include_images else []
+
+                result = {
                     "raw_content": content,
+                    "text_content": text_content,
                     "screenshot_segments": base64_segments,
+                    "metadata": {
+                        "status": response.status,
+                        "final_url": page.url,
+                        "fetched_at": time.time(),
+                        "renderer": "chromium",
+                        "extraction": "browser" if in_browser_extraction else "python",
+                        "has_screenshots": include_images,
+                        "wait_strategy": strategy,
+                        "partial": timed_out,
+                    },
                 }
+                return result
+            except ThrottledError:
+                raise
             except ScrapingError as e:
                 print(f"Scraping error during page operations for {url}: {e}")
                 
@@ -144,59 +385,250 @@ async def scrape_url_with_render(url: str) -> dict:
 
                 
             except Exception as e:
+                if not BrowserManager.is_alive(page):
+                    raise BrowserCrashedError(f"Browser crashed while scraping {url}: {e}")
                 print(f"Error during page operations for {url}: {e}")
                 return {"raw_content": f"Error processing the page: {str(e)}"}
                 
+    except (ThrottledError, BrowserCrashedError):
+        raise
     except Exception as e:
         print(f"Error scraping {url} with render: {str(e)}")
         return {"raw_content": f"Error fetching the URL: {str(e)}"}
 
+async def _capture_screenshot_segments(page) -> List[str]:
+    """Capture the top of the page as downscaled screenshot segments, processed off the event loop."""
+    if screenshot_capture_mode == "full":
+        return await _capture_full_page_segments(page)
+    return await _capture_clipped_segments(page)
+
+async def _capture_full_page_segments(page) -> List[str]:
+    """Take a full-page screenshot and split it into segments."""
+    # Take one full screenshot into memory
+    screenshot_bytes = await page.screenshot({
+        'fullPage': True,
+        'type': 'png'
+    })
+
+    # Cropping, resizing and encoding is CPU bound, so it runs in the process pool
+    segments = await run_in_process(
+        split_screenshot,
+        screenshot_bytes,
+        max_segments=max_screenshot_segments,
+        image_format=screenshot_format,
+        quality=screenshot_quality
+    )
+    print(f"received {len(segments)} segments")
+
+    return segments
+
+async def _capture_clipped_segments(page) -> List[str]:
+    """
+    Screenshot the page one segment-sized viewport at a time.
+
+    The viewport is resized to the segment height and scrolled down segment by segment,
+    stopping at the segment budget, so the full page bitmap is never materialised.
+    """
+    width = (page.viewport or {}).get('width', 800)
+    page_height = await page.evaluate(
+        '() => Math.max(document.body ? document.body.scrollHeight : 0, document.documentElement.scrollHeight)'
+    )
+    num_segments = min(-(-page_height // SEGMENT_HEIGHT), max_screenshot_segments)  # Ceiling division
+    await page.setViewport({'width': width, 'height': SEGMENT_HEIGHT})
+
+    tasks = []
+    for i in range(num_segments):
+        start_y = i * SEGMENT_HEIGHT
+        # The browser clamps scrolling at the bottom, so the last segment may overlap the previous one
+        scroll_y = await page.evaluate(f'() => {{ window.scrollTo(0, {start_y}); return window.scrollY; }}')
+        screenshot_bytes = await page.screenshot({'type': 'png'})
+        tasks.append(asyncio.ensure_future(run_in_process(
+            process_segment,
+            screenshot_bytes,
+            crop_top=int(start_y - scroll_y),
+            image_format=screenshot_format,
+            quality=screenshot_quality
+        )))
+
+    segments = list(await asyncio.gather(*tasks))
+    print(f"received {len(segments)} segments")
+
+    return segments
+
+async def _read_body(response: aiohttp.ClientResponse, max_bytes: int) -> bytes:
+    """Read a response body until EOF or max_bytes, StreamReader.read(n) only returns what is already buffered."""
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(64 * 1024):
+        body += chunk
+        if len(body) >= max_bytes:
+            print(f"response body of {str(response.url)[:100]} cut off at {max_bytes} bytes")
+            break
+    return bytes(body[:max_bytes])
+
+async def fetch_url_async(url: str, session: aiohttp.ClientSession) -> dict:
+    """
+    Fetches a URL with a plain async HTTP GET, without rendering.
+
+    Args:
+        url (str): The URL to fetch.
+        session (aiohttp.ClientSession): Session used for connection reuse.
+
+    Returns:
+        dict: Scrape result with raw_content, text_content and metadata, or an error raw_content.
+    Raises:
+        ThrottledError: If the host answered with 429 or 503.
+    """
+    try:
+        async with host_limiter.slot(url), scrape_scheduler.window():
+            async with session.get(url, headers=browser_headers, timeout=aiohttp.ClientTimeout(total=http_fetch_timeout)) as response:
+                if response.status in (429, 503):
+                    raise ThrottledError(
+                        f"Throttled fetching {url}: {response.status}",
+                        retry_after=parse_retry_after(response.headers.get('Retry-After'))
+                    )
+                if response.status >= 400:
+                    return {"raw_content": f"Error fetching the URL: HTTP {response.status}"}
+                content_type = response.headers.get("Content-Type", "")
+                if "html" not in content_type:
+                    return {"raw_content": f"Error fetching the URL: unsupported content type {content_type}"}
+                body = await _read_body(response, http_fetch_max_bytes)
+                content = body.decode(response.charset or "utf-8", errors="replace")
+                print(f"received http response from {url[:100]} with length", len(content))
+                return {
+                    "raw_content": content,
+                    "metadata": {
+                        "status": response.status,
+                        "final_url": str(response.url),
+                        "fetched_at": time.time(),
+                        "renderer": "http",
+                    },
+                }
+    except ThrottledError:
+        raise
+    except Exception as e:
+        print(f"Error fetching {url} over http: {e}")
+        return {"raw_content": f"Error fetching the URL: {e}"}
+
+async def scrape_url_tiered(url: str, session: aiohttp.ClientSession) -> dict:
+    """
+    Fetches a URL with the cheapest tier that yields usable content.
+
+    A plain HTTP GET is tried first and the page is only rendered with Chromium if the
+    response looks like a JavaScript shell or failed. Domains that needed rendering
+    before skip the HTTP probe. Concurrent calls for the same page share one fetch.
+
+    Args:
+        url (str): The URL to scrape.
+        session (aiohttp.ClientSession): Session used for the HTTP tier.
+
+    Returns:
+        dict: Scrape result as returned by scrape_url_with_render.
+    """
+    key = canonicalize_url(url)
+    # Any render of the page in flight is at least as good as the tiered result
+    for pending_key in ((RENDER_TIER, key, False), (RENDER_TIER, key, True)):
+        pending = scrape_flights.pending(pending_key)
+        if pending is not None:
+            print(f"joining in-flight render of {url[:100]}")
+            return await scrape_flights.join(pending)
+    return await scrape_flights.run(("tiered", key), _scrape_url_tiered, url, session)
+
+async def _scrape_url_tiered(url: str, session: aiohttp.ClientSession) -> dict:
+    cached = await _get_cached_page(url)
+    if cached:
+        return cached
+
+    if await tier_memory.preferred_tier(url) != RENDER_TIER:
+        try:
+            result = await fetch_url_async(url, session)
+        except ThrottledError as e:
+            host_limiter.record_throttle(url, e.retry_after)
+            result = {}
+        if "metadata" in result and not looks_like_js_shell(result["raw_content"]):
+            host_limiter.record_success(url)
+            await tier_memory.record(url, HTTP_TIER)
+            result["text_content"] = await extract_text_from_html_async(result["raw_content"])
+            _annotate_result(url, result, await _fingerprint_async(result.get("text_content")))
+            await _cache_page(url, result)
+            return result
+        print(f"escalating {url[:100]} to rendering")
+
+    result = await scrape_url_with_render(url, include_images=False)
+    if "metadata" in result:
+        await tier_memory.record(url, RENDER_TIER)
+    return result
+
+def scrape_urls(urls: List[str]) -> List[dict]:
+    """
+    Scrape URLs concurrently over the shared connection pool.
+
+    Args:
+        urls (list[str]): The URLs to scrape.
+
+    Returns:
+        list[dict]: Scrape results in the same order as urls.
+    """
+    return list(_scrape_executor.map(scrape_url, urls))
+
 def extract_text_from_html(html_content: str) -> str:
-    """Extract readable text content from HTML using BeautifulSoup."""
+    """Extract readable text content from HTML with the configured HTML_TEXT_BACKEND."""
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-            
-        # Get text and clean it up
-        text = soup.get_text(separator='\n', strip=True)
-        
-        # Remove empty lines and excessive whitespace
-        lines = (line.strip() for line in text.splitlines())
-        text = '\n'.join(line for line in lines if line)
-        
-        return text
+        return html_to_text(html_content)
     except Exception as e:
         print(f"Error extracting text from HTML: {str(e)}")
         return None
 
+async def extract_text_from_html_async(html_content: str) -> str:
+    """Extract readable text content from HTML in the process pool, keeping the event loop free."""
+    try:
+        return await run_in_process(html_to_text, html_content)
+    except Exception as e:
+        print(f"Error extracting text from HTML: {str(e)}")
+        return None
+
+def extract_main_content_from_html(html_content: str) -> str:
+    """Extract the main content text of a page, without navigation, footers and link lists."""
+    try:
+        return extract_main_content(html_content)
+    except Exception as e:
+        print(f"Error extracting main content from HTML: {str(e)}")
+        return None
+
+async def extract_main_content_from_html_async(html_content: str) -> str:
+    """Extract the main content text of a page in the process pool."""
+    try:
+        return await run_in_process(extract_main_content, html_content)
+    except Exception as e:
+        print(f"Error extracting main content from HTML: {str(e)}")
+        return None
+
 
 
 @traceable
 def serper_search(query):
     """Search the web using the Serper API."""
-    # First get search results from Serper
-    url = "https://google.serper.dev/search"
-    payload = json.dumps({
-        "q": query
-    })
-    headers = {
-        'x-api-key': serper_api_key,
-        'Content-Type': 'application/json'
-    }
-
-    response = requests.request("POST", url, headers=headers, data=payload)
-    search_results = json.loads(response.text)
+    # First get search results from Serper, unless the query was answered recently
+    payload = {"q": query}
+    cache_key = _query_cache_key(payload)
+    search_results = query_cache.get(cache_key) if query_cache_enabled else None
+    if search_results is None:
+        headers = {
+            'x-api-key': serper_api_key,
+            'Content-Type': 'application/json'
+        }
+        # API calls go out with their own headers, not the scraping session's browser headers
+        response = requests.post(serper_search_url, headers=headers, data=json.dumps(payload))
+        search_results = json.loads(response.text)
+        if query_cache_enabled and _cacheable_search_result(search_results):
+            query_cache.set(cache_key, search_results)
     
     # Extract URLs to scrape
     urls_to_scrape = []
     if "organic" in search_results:
         urls_to_scrape.extend([item["link"] for item in search_results["organic"][:5]])
     
-    # Scrape all URLs
-    scraped_contents = [scrape_url(url) for url in urls_to_scrape]
+    # Scrape all URLs at the same time
+    scraped_contents = scrape_urls(urls_to_scrape)
     
     # Combine search results with scraped content
     tavily_formatted_result = {
@@ -215,27 +647,36 @@ def serper_search(query):
 
     return tavily_formatted_result
 
-async def scrape_all_urls(urls, use_render=False, batch_size=3):
-    """Scrape URLs with controlled concurrency"""
-    results = []
-    
-    for i in range(0, len(urls), batch_size):
-        batch = urls[i:i + batch_size]
-        tasks = [scrape_url_with_render(url) for url in batch]
-        batch_results = await asyncio.gather(*tasks)
-        results.extend(batch_results)
-        
+async def scrape_all_urls(urls, use_render=None, concurrency=None, include_images=True):
+    """
+    Scrape URLs with a sliding window of concurrent fetches.
+
+    Args:
+        urls (list[str]): The URLs to scrape.
+        use_render (bool, optional): True always renders with Chromium, None tries a
+            plain HTTP fetch first and only renders pages that need it.
+        concurrency (int, optional): Maximum scrapes in flight for this call, capped by SCRAPE_CONCURRENCY.
+        include_images (bool): Whether rendered pages should be screenshotted.
+
+    Returns:
+        list[dict]: Scrape results in the same order as urls.
+    """
+    if use_render:
+        return await scrape_scheduler.map(lambda url: scrape_url_with_render(url, include_images), urls, concurrency=concurrency)
 
-    return results
+    connector = aiohttp.TCPConnector(limit_per_host=host_limiter.max_concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await scrape_scheduler.map(lambda url: scrape_url_tiered(url, session), urls, concurrency=concurrency)
 
 @traceable
-async def serper_search_async(search_queries, max_results=5, tavily_topic="general", tavily_days=30, include_images=True):
+async def serper_search_async(search_queries, max_results=5, tavily_topic="general", tavily_days=30, include_images=True, scrape_concurrency=None):
     """Performs asynchronous web searches using the Serper API."""
     try:
         # Store the current event loop for cleanup
         
         all_results = []
-        use_render = True
+        # Screenshots need a browser, otherwise only pages that need JavaScript are rendered
+        use_render = True if include_images else None
         
         # Create a set to track scraped URLs
         scraped_urls = set()
@@ -243,36 +684,39 @@ async def serper_search_async(search_queries, max_results=5, tavily_topic="gener
         # Format queries for batch request
         queries_payload = [{"q": query} for query in search_queries]
         
-        # Make single batch request to Serper
-        url = "https://google.serper.dev/search"
-        headers = {
-            'x-api-key': serper_api_key,
-            'Content-Type': 'application/json'
-        }
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=json.dumps(queries_payload)) as response:
-                all_search_results = await response.json()
+        # Make single batch request to Serper for the queries that are not cached
+        all_search_results = await _serper_batch_search(queries_payload)
         
-        # Flatten the list of organic results
+        # Flatten the list of organic results, remembering which query found each one
         organic_results = [
-            item 
-            for search_results in all_search_results 
+            {**item, "query": query}
+            for query, search_results in zip(search_queries, all_search_results)
             if "organic" in search_results
             for item in search_results["organic"][:max_results]
         ]
         
-        unique_organic_urls = set([item["link"] for item in organic_results])
+        # Only the first max_results are returned, so only those are scraped
+        returned_results = organic_results[:max_results]
+
+        # Equivalent URLs (tracking parameters, www, AMP variants, ...) are scraped once, using the first link seen
+        canonical_links = {item["link"]: canonicalize_url(item["link"]) for item in organic_results}
+        unique_organic_urls = {}
+        for item in returned_results:
+            unique_organic_urls.setdefault(canonical_links[item["link"]], item["link"])
+        # Every query that found a page counts for its passage selection, also those past the cap
+        queries_by_url = {}
+        for item in organic_results:
+            queries_by_url.setdefault(canonical_links[item["link"]], {}).setdefault(item["query"], None)
         print("scraping ", len(unique_organic_urls), " unique organic results")
-        urls_to_scrape = list(unique_organic_urls)
+        urls_to_scrape = list(unique_organic_urls.values())
 
-        # Scrape only unique URLs
-        scraped_contents = await scrape_all_urls(urls_to_scrape)
+        # Scrape only unique URLs on the scrape service loop, which owns the warm browser pool
+        scraped_contents = await scrape_service.run(scrape_all_urls, urls_to_scrape, use_render=use_render, concurrency=scrape_concurrency, include_images=include_images)
         
         # Create mapping of URL to scraped content for easy lookup
         url_to_content = {
-            urls_to_scrape[i]: content 
-            for i, content in enumerate(scraped_contents)
+            canonical: content
+            for canonical, content in zip(unique_organic_urls, scraped_contents)
         }
         
         # Format results
@@ -280,15 +724,24 @@ async def serper_search_async(search_queries, max_results=5, tavily_topic="gener
             "results": []
         }
         
-        for item in organic_results[:max_results]:
+        for item in returned_results:
             url = item.get("link", "")
-            if url in url_to_content:
-                scraped_content = url_to_content[url]
+            canonical = canonical_links.get(url)
+            if canonical in url_to_content and canonical not in scraped_urls:
+                scraped_urls.add(canonical)
+                scraped_content = url_to_content[canonical]
                 tavily_formatted_result["results"].append({
                     "title": item.get("title", ""),
                     "url": url,
                     "content": item.get("snippet", ""),
+                    # The queries that found the page, used to pick its most relevant passages
+                    "query": item["query"],
+                    "queries": list(queries_by_url[canonical]),
                     "raw_content": scraped_content.get("raw_content", ""),
+                    # Extracted once at scrape time so formatting never reparses the HTML
+                    "text_content": scraped_content.get("text_content"),
+                    "main_text_content": scraped_content.get("main_text_content"),
+                    "metadata": scraped_content.get("metadata", {}),
                     "screenshot_segments": scraped_content.get("screenshot_segments", []) if include_images else [],
                 })
         
@@ -300,6 +753,184 @@ async def serper_search_async(search_queries, max_results=5, tavily_topic="gener
         print(f"Error during serper_search_async: {e}")
         return []
 
+def _source_fingerprint(source: dict, main_content: bool = False) -> Union[List[int], None]:
+    """Fingerprint of the text the formatter sends, the main content's when main_content is set."""
+    metadata = source.get('metadata') or {}
+    # Site chrome differs between sites, so copies of an article only look alike without it
+    if main_content and _main_text(source):
+        if 'main_minhash' not in metadata:
+            return _store_main_fingerprint(source, minhash(source['main_text_content'], min_words=near_duplicate_min_words))
+        return metadata['main_minhash']
+    if 'minhash' in metadata:
+        return metadata['minhash']
+    # Results cached before fingerprints were stored at scrape time
+    return minhash(source.get('text_content') or '', min_words=near_duplicate_min_words)
+
+def _store_main_fingerprint(source: dict, fingerprint: Union[List[int], None]) -> Union[List[int], None]:
+    if isinstance(source.get('metadata'), dict):
+        source['metadata']['main_minhash'] = fingerprint
+    return fingerprint
+
+def _main_text(source: dict) -> str:
+    """The source's main content, extracted and kept on the source on first use."""
+    main_text = source.get('main_text_content')
+    if main_text is None and looks_like_html(source.get('raw_content') or ''):
+        main_text = _store_main_content(source, extract_main_content_from_html(source['raw_content']))
+    return main_text or ''
+
+def _source_text(source: dict, main_content: bool = False) -> str:
+    text_content = source.get('text_content')
+    if text_content is None:
+        # Results from before text was stored at scrape time
+        text_content = extract_text_from_html(source.get('raw_content') or '')
+    if main_content:
+        main_text = _main_text(source)
+        if main_text:
+            print(f"main content of {source.get('url', '')[:100]}: {len(main_text)} of {len(text_content or '')} characters ({main_content_ratio(main_text, text_content or ''):.0%})")
+            return main_text
+    return text_content or ''
+
+def _store_main_content(source: dict, main_text: Union[str, None]) -> str:
+    """Keep the extracted main content on the source itself, so later formatting calls reuse it."""
+    # An empty string marks a failed extraction, so the formatter falls back to the full text
+    source['main_text_content'] = main_text or ''
+    if main_text and source.get('text_content') and isinstance(source.get('metadata'), dict):
+        source['metadata']['main_content_ratio'] = main_content_ratio(main_text, source.get('text_content') or '')
+    return source['main_text_content']
+
+async def _cache_main_content(source: dict):
+    """Add a source's main content to its page cache entry, keeping the entry's expiry."""
+    if not page_cache_enabled:
+        return
+    key = _page_cache_key(source['url'])
+    cached = await page_cache.aget(key)
+    if not cached or cached.get('main_text_content') is not None:
+        return
+    cached['main_text_content'] = source['main_text_content']
+    metadata = cached.setdefault('metadata', {})
+    for name in ('main_content_ratio', 'main_minhash'):
+        if name in (source.get('metadata') or {}):
+            metadata[name] = source['metadata'][name]
+    now = time.time()
+    await page_cache.aset(key, cached, page_cache.default_ttl - (now - metadata.get('fetched_at', now)))
+
+def _source_queries(sources: List[dict]) -> List[str]:
+    """The search queries that returned any of the sources, in order of first appearance."""
+    queries = {}
+    for source in sources:
+        for query in source.get('queries') or ([source['query']] if source.get('query') else []):
+            queries.setdefault(query, None)
+    return list(queries)
+
+def _format_source(source: dict, text_content: str, max_tokens_per_source: int, include_raw_content: bool, images_per_source: int, duplicate_urls: List[str] = ()) -> List[dict]:
+    """Format a single source with its selected passages as message content blocks, reusing earlier results for the same source and limits."""
+    raw_content = (source.get('raw_content') or '') if include_raw_content else ''
+    segments = source.get("screenshot_segments", [])[:images_per_source]
+
+    # str objects cache their hash, so fingerprinting repeated results is cheap
+    fingerprint = hash((source.get('title'), source.get('content'), text_content, raw_content, tuple(segments), tuple(duplicate_urls)))
+    key = (source.get('url'), max_tokens_per_source, images_per_source, include_raw_content)
+    with _formatted_source_memo_lock:
+        memoized = _formatted_source_memo.get(key)
+        if memoized is not None and memoized[0] == fingerprint:
+            _formatted_source_memo.move_to_end(key)
+            return memoized[1]
+
+    formatted_text = ""
+    formatted_text += f"Source {source.get('title', 'N/A')}:\n===\n"
+    formatted_text += f"URL: {source.get('url', 'N/A')}\n===\n"
+    if duplicate_urls:
+        formatted_text += f"Same content also published at: {', '.join(duplicate_urls)}\n===\n"
+    formatted_text += f"Most relevant content from source: {source.get('content', 'N/A')}\n===\n"
+
+    formatted_text += f"Text content from source: {text_content}\n===\n"
+
+    if include_raw_content:
+        raw_content = truncate_to_tokens(raw_content, max_tokens_per_source)
+        formatted_text += f"Full source content limited to {max_tokens_per_source} tokens: {raw_content}\n\n"
+
+    blocks = [
+        {
+            "type": "text",
+            "text": formatted_text
+        }
+    ] + [{
+        "type": "image_url",
+        "image_url": {
+            "url": segment
+        }
+    } for segment in segments]
+
+    with _formatted_source_memo_lock:
+        _formatted_source_memo[key] = (fingerprint, blocks)
+        _formatted_source_memo.move_to_end(key)
+        while len(_formatted_source_memo) > formatted_source_memo_size:
+            _formatted_source_memo.popitem(last=False)
+    return blocks
+
+async def deduplicate_and_format_sources_async(
+    search_response: Union[Dict, List[Dict]],
+    max_tokens_per_source: int,
+    include_raw_content: bool = False,
+    images_per_source: int = max_screenshot_segments,
+    max_tokens_per_prompt: int = None,
+    queries: List[str] = None,
+    main_content: bool = False
+) -> List[dict]:
+    """
+    Awaitable deduplicate_and_format_sources for use inside async graph nodes.
+
+    Sources without stored text_content (results cached before it was stored at scrape
+    time) and, with main_content, sources whose main content was not extracted yet are
+    parsed concurrently in the process pool first. Main content is only extracted when
+    asked for, and kept on the source and in the page cache. Passage scoring and
+    token counting run in the process pool as well, so the event loop only does the
+    memo lookups.
+    """
+    if not isinstance(search_response, (dict, list)):
+        raise ValueError("Input must be either a dict with 'results' or a list of search results")
+    sources_list = get_unique_urls(search_response)
+    # Only the first source per URL is formatted, so only those need parsing
+    first_by_url = {}
+    for source in sources_list:
+        if source.get('url'):
+            first_by_url.setdefault(_source_key(source), source)
+    missing = [source for source in first_by_url.values() if source.get('text_content') is None]
+    missing_main = [
+        source for source in first_by_url.values()
+        if main_content and source.get('main_text_content') is None and looks_like_html(source.get('raw_content') or '')
+    ]
+    if missing or missing_main:
+        texts, main_texts = await asyncio.gather(
+            asyncio.gather(*(extract_text_from_html_async(source.get('raw_content') or '') for source in missing)),
+            asyncio.gather(*(extract_main_content_from_html_async(source['raw_content']) for source in missing_main)),
+        )
+        for source, main_text in zip(missing_main, main_texts):
+            _store_main_content(source, main_text)
+        updated = {id(source): text for source, text in zip(missing, texts)}
+        sources_list = [
+            {**source, "text_content": updated[id(source)]} if id(source) in updated else source
+            for source in sources_list
+        ]
+    # Near-duplicates are judged on the main content, which is fingerprinted once per page
+    unfingerprinted = [
+        source for source in first_by_url.values()
+        if main_content and near_duplicate_threshold > 0 and source.get('main_text_content') and 'main_minhash' not in (source.get('metadata') or {})
+    ]
+    fingerprints = await asyncio.gather(*(_fingerprint_async(source['main_text_content']) for source in unfingerprinted))
+    for source, fingerprint in zip(unfingerprinted, fingerprints):
+        _store_main_fingerprint(source, fingerprint)
+    # Pages fetched again later start from the cached entry, so they skip the extraction too
+    await asyncio.gather(*(_cache_main_content(source) for source in missing_main))
+    source_groups = _group_sources(sources_list, main_content)
+    inputs = _selection_inputs(source_groups, queries, main_content)
+    budgets = (max_tokens_per_source, max_tokens_per_prompt or max_source_tokens_per_prompt)
+    key = _selection_key(source_groups, inputs, budgets, main_content)
+    selected_texts = _memoized_selection(key)
+    if selected_texts is None:
+        selected_texts = _memoize_selection(key, await run_in_process(select_passages, inputs, *budgets))
+    return _format_groups(source_groups, selected_texts, max_tokens_per_source, include_raw_content, images_per_source)
+
 def get_unique_urls(search_response):
     if isinstance(search_response, dict):
         sources_list = search_response.get('results', [])
@@ -313,18 +944,26 @@ def deduplicate_and_format_sources(
     search_response: Union[Dict, List[Dict]],
     max_tokens_per_source: int,
     include_raw_content: bool = False,
-    images_per_source: int = 5
+    images_per_source: int = max_screenshot_segments,
+    max_tokens_per_prompt: int = None,
+    queries: List[str] = None,
+    main_content: bool = False
 ) -> str:
     print("deduplicate_and_format_sources")
     """
     Takes either a single search response or list of responses and formats them.
-    Limits the raw_content to approximately max_tokens_per_source.
+    The text of each source is reduced to the passages most relevant to the queries that
+    found it, within max_tokens_per_source tokens per source and max_tokens_per_prompt
+    tokens overall.
     include_raw_content specifies whether to include the raw_content in the formatted string.
     
     Args:
         search_response: Either:
             - A dict with a 'results' key containing a list of search results
             - A list of dicts, each containing search results
+        max_tokens_per_prompt: Token budget of all sources' text, defaults to MAX_SOURCE_TOKENS_PER_PROMPT.
+        queries: Queries to rank passages by, defaults to the queries recorded on each result.
+        main_content: Use only the main content of each page, without navigation, footers and link lists.
             
     Returns:
         str: Formatted string with deduplicated sources
@@ -339,50 +978,67 @@ def deduplicate_and_format_sources(
     else:
         raise ValueError("Input must be either a dict with 'results' or a list of search results")
     
-    # Deduplicate by URL
+    source_groups = _group_sources(sources_list, main_content)
+    # Fill the token budgets with the passages that best match the originating queries
+    inputs = _selection_inputs(source_groups, queries, main_content)
+    budgets = (max_tokens_per_source, max_tokens_per_prompt or max_source_tokens_per_prompt)
+    key = _selection_key(source_groups, inputs, budgets, main_content)
+    selected_texts = _memoized_selection(key)
+    if selected_texts is None:
+        selected_texts = _memoize_selection(key, select_passages(inputs, *budgets))
+    return _format_groups(source_groups, selected_texts, max_tokens_per_source, include_raw_content, images_per_source)
+
+def _group_sources(sources_list: List[dict], main_content: bool = False) -> List[tuple]:
+    """Deduplicate sources and fold near-duplicates, returning (source, near-duplicates) pairs."""
+    # Deduplicate by canonical URL, including the page's own rel=canonical link
     unique_sources = {}
     for source in sources_list:
-        if source.get('url') and source['url'] not in unique_sources:
-            unique_sources[source['url']] = source
-    
-    # Format output
+        if source.get('url'):
+            unique_sources.setdefault(_source_key(source), source)
+
+    # Fold near-duplicate pages (syndicated or mirrored content) into the first one, keeping their URLs for citation
+    if near_duplicate_threshold > 0:
+        return fold_near_duplicates(list(unique_sources.values()), lambda source: _source_fingerprint(source, main_content), near_duplicate_threshold)
+    return [(source, []) for source in unique_sources.values()]
+
+def _selection_inputs(source_groups: List[tuple], queries: List[str], main_content: bool) -> List[tuple]:
+    """(text, queries) per source group, as taken by select_passages."""
+    return [(_source_text(source, main_content), queries or _source_queries([source, *duplicates])) for source, duplicates in source_groups]
+
+def _selection_key(source_groups: List[tuple], inputs: List[tuple], budgets: tuple, main_content: bool) -> tuple:
+    """Memo key of a passage selection, the sources compete for the total budget so all of them are part of it."""
+    # str objects cache their hash, so fingerprinting repeated texts is cheap
+    sources = tuple(
+        (_source_key(source), len(text), hash(text), tuple(source_queries))
+        for (source, _), (text, source_queries) in zip(source_groups, inputs)
+    )
+    return sources, budgets, main_content
+
+def _memoized_selection(key: tuple) -> Union[List[str], None]:
+    with _formatted_source_memo_lock:
+        selected = _passage_selection_memo.get(key)
+        if selected is not None:
+            _passage_selection_memo.move_to_end(key)
+        return selected
+
+def _memoize_selection(key: tuple, selected: List[str]) -> List[str]:
+    with _formatted_source_memo_lock:
+        _passage_selection_memo[key] = selected
+        _passage_selection_memo.move_to_end(key)
+        while len(_passage_selection_memo) > passage_selection_memo_size:
+            _passage_selection_memo.popitem(last=False)
+    return selected
+
+def _format_groups(source_groups: List[tuple], selected_texts: List[str], max_tokens_per_source: int, include_raw_content: bool, images_per_source: int) -> List[dict]:
     formatted_sources = [{
         "type": "text",
         "text": "Sources:\n\n"
     }]
-    for source in unique_sources.values():
-        formatted_text = ""
-        formatted_text += f"Source {source.get('title', 'N/A')}:\n===\n"
-        formatted_text += f"URL: {source.get('url', 'N/A')}\n===\n"
-        formatted_text += f"Most relevant content from source: {source.get('content', 'N/A')}\n===\n"
-        
-        char_limit = max_tokens_per_source * 4
-        text_content = extract_text_from_html(source.get('raw_content', ''))
-        if text_content:
-            text_content = text_content[:char_limit] + "... [truncated]"
-        formatted_text += f"Text content from source: {text_content or ''}\n===\n"
-        
-        if include_raw_content:
-            print("include_raw_content", source.get('raw_content'))
-            # Using rough estimate of 4 characters per token
-            if len(raw_content) > char_limit:
-                raw_content = raw_content[:char_limit] + "... [truncated]"
-            formatted_text += f"Full source content limited to {max_tokens_per_source} tokens: {raw_content}\n\n"
-        formatted_text.strip()   
-
-        source = [
-            {
-                "type": "text",
-                "text": formatted_text
-            }
-        ] + [{
-            "type": "image_url",
-            "image_url": {
-                "url": segment
-            }
-        } for segment in source.get("screenshot_segments", [])[:images_per_source]]
-
-        formatted_sources.extend(source)
+    for (source, duplicates), text_content in zip(source_groups, selected_texts):
+        duplicate_urls = [duplicate.get('url') for duplicate in duplicates]
+        if duplicate_urls:
+            print(f"folded {len(duplicate_urls)} near-duplicate sources into {source.get('url', '')[:100]}")
+        formatted_sources.extend(_format_source(source, text_content, max_tokens_per_source, include_raw_content, images_per_source, duplicate_urls))
 
 
     return formatted_sources
@@ -0,0 +1,65 @@
+import asyncio
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into a single execution.
+
+    The first caller for a key starts the work; callers arriving while it runs await the
+    same task instead of starting their own. Once the task finishes the key is released,
+    so later calls run again (and typically hit a cache). Tasks are tracked per event loop.
+    """
+
+    def __init__(self):
+        self._inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, asyncio.Future]]" = weakref.WeakKeyDictionary()
+        self.started = 0
+        self.coalesced = 0
+
+    def _tasks(self) -> Dict[Hashable, asyncio.Future]:
+        loop = asyncio.get_running_loop()
+        tasks = self._inflight.get(loop)
+        if tasks is None:
+            tasks = self._inflight[loop] = {}
+        return tasks
+
+    def pending(self, key: Hashable) -> Optional[asyncio.Future]:
+        """Return the task currently running for a key, or None."""
+        return self._tasks().get(key)
+
+    async def run(self, key: Hashable, coro_fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        Run coro_fn for the key, or join the run already in flight.
+
+        Args:
+            key (Hashable): Identifies equivalent calls.
+            coro_fn (Callable): Coroutine function doing the work.
+            *args, **kwargs: Arguments passed to coro_fn when a new run is started.
+
+        Returns:
+            Any: The result of the shared run.
+        """
+        tasks = self._tasks()
+        task = tasks.get(key)
+        if task is None:
+            self.started += 1
+            task = tasks[key] = asyncio.ensure_future(coro_fn(*args, **kwargs))
+
+            def release(finished):
+                if tasks.get(key) is finished:
+                    del tasks[key]
+
+            task.add_done_callback(release)
+        else:
+            self.coalesced += 1
+        return await self.join(task)
+
+    @staticmethod
+    async def join(task: asyncio.Future) -> Any:
+        """Await a shared task without cancelling it for the other callers if this one is cancelled."""
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        """Return the number of started runs, joined runs and runs currently in flight."""
+        return {"started": self.started, "coalesced": self.coalesced, "in_flight": sum(len(tasks) for tasks in self._inflight.values())}
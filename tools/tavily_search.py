@@ -3,6 +3,11 @@ import asyncio
 from langsmith import traceable
 from typing import List, Union, Dict
 import os
+
+from .url_canonicalization import canonicalize_url
+from .html_text import extract_main_content, looks_like_html
+from .process_pool import run_in_process
+
 tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
 tavily_async_client = AsyncTavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
 
@@ -54,24 +59,69 @@ def get_unique_urls(search_response):
         for response in search_response:
             sources_list.extend(response.get('results', []) if isinstance(response, dict) else response)
     
-    # Extract and return unique URLs
-    unique_urls = set()
+    # Extract and return unique URLs, keeping the first of equivalent ones
+    unique_urls = {}
     for source in sources_list:
         if url := source.get('url'):  # Using walrus operator to check and assign
-            unique_urls.add(url)
+            unique_urls.setdefault(canonicalize_url(url), url)
     
-    return list(unique_urls)
+    return list(unique_urls.values())
     
 
+def _main_content_of(url: str, raw_content: str, main_text: str) -> str:
+    print(f"main content of {url[:100]}: {len(main_text)} characters from {len(raw_content)} characters of HTML")
+    return main_text or raw_content
+
+
+async def deduplicate_and_format_sources_async(
+    search_response: Union[Dict, List[Dict]],
+    max_tokens_per_source: int,
+    include_raw_content: bool = True,
+    main_content: bool = False
+) -> str:
+    """
+    Awaitable deduplicate_and_format_sources for use inside async graph nodes.
+
+    With main_content, the main content of HTML raw_content is extracted in the process
+    pool, so the event loop never parses pages.
+    """
+    if not main_content or not include_raw_content:
+        return deduplicate_and_format_sources(search_response, max_tokens_per_source, include_raw_content, main_content)
+    if isinstance(search_response, dict):
+        sources_list = search_response.get('results', [])
+    elif isinstance(search_response, list):
+        sources_list = []
+        for response in search_response:
+            sources_list.extend(response.get('results', []) if isinstance(response, dict) else response)
+    else:
+        raise ValueError("Input must be either a dict with 'results' or a list of search results")
+
+    html_sources = [source for source in sources_list if looks_like_html(source.get('raw_content') or '')]
+    main_texts = await asyncio.gather(*(run_in_process(extract_main_content, source['raw_content']) for source in html_sources))
+    extracted = {
+        id(source): _main_content_of(source.get('url', ''), source['raw_content'], main_text)
+        for source, main_text in zip(html_sources, main_texts)
+    }
+    sources_list = [
+        {**source, 'raw_content': extracted[id(source)]} if id(source) in extracted else source
+        for source in sources_list
+    ]
+    # raw_content already holds the main content, or the page when nothing was extracted
+    return deduplicate_and_format_sources({'results': sources_list}, max_tokens_per_source, include_raw_content, main_content=False)
+
+
 def deduplicate_and_format_sources(
     search_response: Union[Dict, List[Dict]],
     max_tokens_per_source: int,
-    include_raw_content: bool = True
+    include_raw_content: bool = True,
+    main_content: bool = False
 ) -> str:
     """
     Takes either a single search response or list of responses from Tavily API and formats them.
     Limits the raw_content to approximately max_tokens_per_source.
     include_raw_content specifies whether to include the raw_content from Tavily in the formatted string.
+    main_content reduces raw_content that is HTML to the page's main content. Tavily
+    usually returns extracted text already, which is left as is.
     
     Args:
         search_response: Either:
@@ -91,11 +141,11 @@ def deduplicate_and_format_sources(
     else:
         raise ValueError("Input must be either a dict with 'results' or a list of search results")
     
-    # Deduplicate by URL
+    # Deduplicate by canonical URL
     unique_sources = {}
     for source in sources_list:
-        if source.get('url') and source['url'] not in unique_sources:
-            unique_sources[source['url']] = source
+        if source.get('url'):
+            unique_sources.setdefault(canonicalize_url(source['url']), source)
     
     # Format output
     formatted_text = "Sources:\n\n"
@@ -107,6 +157,8 @@ def deduplicate_and_format_sources(
             # Using rough estimate of 4 characters per token
             char_limit = max_tokens_per_source * 4
             raw_content = source.get('raw_content') or ''
+            if main_content and looks_like_html(raw_content):
+                raw_content = _main_content_of(source.get('url', ''), raw_content, extract_main_content(raw_content))
             if len(raw_content) > char_limit:
                 raw_content = raw_content[:char_limit] + "... [truncated]"
             formatted_text += f"Full source content limited to {max_tokens_per_source} tokens: {raw_content}\n\n"
@@ -0,0 +1,157 @@
+import re
+from typing import Optional
+from urllib.parse import parse_qsl, unquote, urlencode, urljoin, urlsplit, urlunsplit
+
+# Query parameters that only identify campaigns, clicks or sessions, never content
+TRACKING_PARAMS = {
+    "gclid", "gclsrc", "dclid", "gbraid", "wbraid", "fbclid", "msclkid", "yclid", "twclid", "ttclid",
+    "igshid", "srsltid", "mc_cid", "mc_eid", "mkt_tok", "_ga", "_gl", "_hsenc", "_hsmi", "hsctatracking",
+    "ref_src", "spm", "trk", "trkcampaign", "s_cid",
+    "cmpid", "oly_anon_id", "oly_enc_id", "vero_id", "wickedid", "rb_clickid",
+}
+TRACKING_PARAM_PREFIXES = ("utm_", "hsa_", "pk_", "piwik_", "mtm_", "ga_", "itm_")
+
+# Subdomains serving the same content as the bare domain
+EQUIVALENT_SUBDOMAINS = ("www.", "m.", "mobile.", "amp.")
+
+_google_amp_viewer = re.compile(r"^/amp/(s/)?(?P<target>.+)$")
+_amp_cache_host = re.compile(r"\.cdn\.ampproject\.org$")
+_amp_cache_path = re.compile(r"^/[a-z](/s)?/(?P<target>.+)$")
+# Only a trailing /amp or .amp after a real path segment, /amp on its own is a page of its own
+_amp_path_suffix = re.compile(r"(?<=[^/])(/amp|\.amp)(?=/?$)")
+_link_tag = re.compile(r"<link\b[^>]*>", re.IGNORECASE)
+_rel_canonical = re.compile(r"\brel\s*=\s*[\"']?canonical[\"'\s>/]", re.IGNORECASE)
+_href = re.compile(r"\bhref\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s>]+))", re.IGNORECASE)
+
+
+def _unwrap_amp_cache(url: str) -> str:
+    """Map Google AMP viewer and AMP cache URLs to the publisher URL they serve."""
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if host in ("google.com", "www.google.com"):
+        match = _google_amp_viewer.match(parts.path)
+    elif _amp_cache_host.search(host):
+        match = _amp_cache_path.match(parts.path)
+    else:
+        return url
+    if not match:
+        return url
+    target = match.group("target")
+    return "https://" + target + (f"?{parts.query}" if parts.query else "")
+
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PARAM_PREFIXES)
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Reduce a URL to a canonical form used for dedup sets and cache keys.
+
+    The scheme is folded to https, the host is lowercased without default ports and
+    www/mobile/AMP subdomains, trailing /amp or .amp path variants and AMP cache URLs are
+    mapped to the regular page, click and campaign tracking parameters and fragments are
+    dropped, remaining query parameters are sorted and duplicate and trailing slashes are
+    removed.
+
+    The result is a key, not necessarily a fetchable URL, so pages are still fetched
+    with the URL the caller passed.
+
+    Args:
+        url (str): The URL to canonicalize.
+
+    Returns:
+        str: The canonical form, or the stripped input if it is not an http(s) URL.
+
+    >>> canonicalize_url("http://www.Example.com/a/?utm_source=x&b=2&a=1#top")
+    'https://example.com/a?a=1&b=2'
+    >>> canonicalize_url("https://m.example.com/news/story/amp/")
+    'https://example.com/news/story'
+    >>> canonicalize_url("https://www-example-com.cdn.ampproject.org/c/s/example.com/news/story")
+    'https://example.com/news/story'
+    >>> canonicalize_url("https://example.com/amp")
+    'https://example.com/amp'
+    >>> canonicalize_url("https://example.com/docs?ref=main&amp=1")
+    'https://example.com/docs?amp=1&ref=main'
+    """
+    url = _unwrap_amp_cache(url.strip())
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+        return url
+
+    host = parts.hostname.lower().rstrip(".")
+    for prefix in EQUIVALENT_SUBDOMAINS:
+        if host.startswith(prefix) and host.count(".") > 1:
+            host = host[len(prefix):]
+            break
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    path = re.sub(r"/{2,}", "/", unquote(parts.path) or "/")
+    path = _amp_path_suffix.sub("", path)
+    if len(path) > 1:
+        path = path.rstrip("/")
+
+    query = urlencode(sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if not _is_tracking_param(name)))
+    return urlunsplit(("https", host, path, query, ""))
+
+
+def find_rel_canonical(html: str, base_url: str) -> Optional[str]:
+    """Return the absolute href of the document's rel=canonical link, if any."""
+    if not html:
+        return None
+    # The canonical link lives in the head, which is near the start of the document
+    for tag in _link_tag.findall(html[:200000]):
+        if _rel_canonical.search(tag):
+            match = _href.search(tag)
+            if match:
+                href = next(group for group in match.groups() if group is not None).strip()
+                if href:
+                    return urljoin(base_url, href)
+    return None
+
+
+def _is_parent_path(parent: str, path: str) -> bool:
+    return parent == "/" or path.startswith(parent.rstrip("/") + "/")
+
+
+def learned_canonical(url: str, html: str, base_url: Optional[str] = None) -> str:
+    """
+    Return the canonical key of a fetched page, following its rel=canonical link where safe.
+
+    The learned key is only meant for deduplicating sources, never for cache keys: sites
+    point many distinct pages at one canonical. Links to another site, to a parent page
+    (pagination like /blog?page=2 or /blog/page/2 pointing at /blog) or dropping content
+    query parameters (facets, filters) are ignored.
+
+    Args:
+        url (str): The URL the page was requested with.
+        html (str): The fetched document.
+        base_url (str | None): The URL after redirects, used to resolve relative links.
+
+    Returns:
+        str: The canonical key from rel=canonical, or the rule-based one for the URL.
+
+    >>> learned_canonical("https://ex.com/p/1?utm_source=x", '<link rel="canonical" href="/p/1-shoes">')
+    'https://ex.com/p/1-shoes'
+    >>> learned_canonical("https://ex.com/blog?page=2", '<link rel="canonical" href="/blog">')
+    'https://ex.com/blog?page=2'
+    >>> learned_canonical("https://ex.com/blog/page/2", '<link rel="canonical" href="/blog">')
+    'https://ex.com/blog/page/2'
+    >>> learned_canonical("https://ex.com/a", '<link rel="canonical" href="https://other.com/a">')
+    'https://ex.com/a'
+    """
+    source = canonicalize_url(url)
+    href = find_rel_canonical(html, base_url or url)
+    if not href:
+        return source
+    target = canonicalize_url(href)
+    source_parts, target_parts = urlsplit(source), urlsplit(target)
+    if source_parts.netloc != target_parts.netloc:
+        return source
+    if _is_parent_path(target_parts.path, source_parts.path):
+        return source
+    if not set(parse_qsl(source_parts.query, keep_blank_values=True)) <= set(parse_qsl(target_parts.query, keep_blank_values=True)):
+        return source
+    return target